@@ -5,17 +5,27 @@ Main web server that connects the frontend to the RAG pipeline
 
 import os
 import sys
+import atexit
+import logging
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
 
 # Force unbuffered output to prevent "hit enter" issue on some servers
 os.environ['PYTHONUNBUFFERED'] = '1'
 sys.stdout.reconfigure(line_buffering=True) if hasattr(sys.stdout, 'reconfigure') else None
 
-from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context
+from flask import Flask, request, send_from_directory, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from flask_compress import Compress
 from waitress import serve
 from pathlib import Path
-import json
-import ollama
+from functools import lru_cache
+import gzip
+import hashlib
+import orjson
 from datetime import datetime
+from types import MappingProxyType
 from bible_utils import (
     build_bible_index,
     extract_book_name,
@@ -23,15 +33,169 @@ from bible_utils import (
     parse_verses,
     resolve_bible_path,
 )
-from rag_pipeline import BibleRAG, MODE_INSTRUCTIONS, DEFAULT_MODE
+from rag_pipeline import (
+    BibleRAG,
+    MODE_INSTRUCTIONS,
+    DEFAULT_LLM_MODEL,
+    PRAYER_OPTIONS,
+    STUDY_OPTIONS,
+    ollama_client,
+    resolve_mode,
+)
+
+LOG_LEVEL = os.getenv('WWAIJD_LOG_LEVEL', 'INFO').upper()
+logger = logging.getLogger(__name__)
+
+
+def _configure_logging():
+    """
+    Send log records through a queue to a background listener thread so request
+    threads never block on terminal I/O. Re-run after forking, since the
+    listener thread does not survive into child processes.
+    """
+    log_queue = queue.SimpleQueue()
+    # QueueHandler formats before enqueueing; the listener just writes the line.
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
+    listener = QueueListener(log_queue, logging.StreamHandler(sys.stdout))
+    logging.basicConfig(level=LOG_LEVEL, handlers=[queue_handler], force=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+
+_configure_logging()
+
+# Shared by every orjson call that builds a response body.
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (UTF-8 bytes straight from Rust)."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=_ORJSON_OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=_ORJSON_OPTIONS),
+            mimetype=self.mimetype
+        )
+
 
 app = Flask(__name__, static_folder='static')
+app.json = OrjsonProvider(app)
+# Let a fronting proxy (Apache mod_xsendfile, lighttpd) stream files via X-Sendfile.
+app.config['USE_X_SENDFILE'] = os.getenv('WWAIJD_USE_X_SENDFILE', '0') == '1'
+STATIC_MAX_AGE = int(os.getenv('WWAIJD_STATIC_MAX_AGE', '3600'))
+# Applies to Flask's built-in /static route as well as send_from_directory calls.
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = STATIC_MAX_AGE
+# Compress JSON only; text/event-stream is left out so SSE chunks are never buffered.
+app.config['COMPRESS_MIMETYPES'] = ['application/json']
+app.config['COMPRESS_LEVEL'] = 4
+app.config['COMPRESS_MIN_SIZE'] = 500
+Compress(app)
 BIBLE_DATA_DIR = (Path(__file__).parent / 'bible-data').resolve()
 OLLAMA_LLM_KEEP_ALIVE = os.getenv('WWAIJD_LLM_KEEP_ALIVE', '120s')
-OLLAMA_EMBED_KEEP_ALIVE = os.getenv('WWAIJD_EMBED_KEEP_ALIVE', '0s')
+OLLAMA_EMBED_KEEP_ALIVE = os.getenv('WWAIJD_EMBED_KEEP_ALIVE', '5m')
+SERVER_HOST = '0.0.0.0'
+SERVER_PORT = 5000
+# WWAIJD_WORKERS > 1 runs gunicorn worker processes (not available on Windows).
+SERVER_WORKERS = int(os.getenv('WWAIJD_WORKERS', '1'))
+# Each open SSE stream holds a thread for the whole answer, so keep headroom.
+SERVER_THREADS = int(os.getenv('WWAIJD_THREADS', '16'))
+# Chapters with more verses than this are streamed instead of serialized in one shot.
+PASSAGE_STREAM_MIN_VERSES = 64
+PASSAGE_STREAM_BATCH = 32
+# Browser/CDN lifetime for responses derived from the corpus (bible index, verse
+# previews). bible-data only changes on deploy, and ETags cover revalidation.
+CORPUS_MAX_AGE = int(os.getenv('WWAIJD_CORPUS_MAX_AGE', '86400'))
+# <lastmod> rolls over daily, so the sitemap is revalidated more often.
+SITEMAP_MAX_AGE = 3600
+# Every chapter fits in the parsed-chapter cache, so nothing is ever evicted.
+KJV_CHAPTER_COUNT = 1189
+
+# Pre-encoded SSE framing shared by the streaming endpoints. Chunk and error
+# frames wrap a single JSON string, so only that string is encoded per event.
+CHUNK_PREFIX = b'event: chunk\ndata: {"text":'
+ERROR_PREFIX = b'event: error\ndata: {"error":'
+PASSAGES_PREFIX = b"event: passages\ndata: "
+OBJECT_SUFFIX = b"}\n\n"
+EVENT_SUFFIX = b"\n\n"
+DONE_FRAME = b"event: done\ndata: " + orjson.dumps({'done': True}) + EVENT_SUFFIX
+MODE_DONE_FRAMES = {
+    mode: b"event: done\ndata: " + orjson.dumps({'done': True, 'mode': mode}) + EVENT_SUFFIX
+    for mode in MODE_INSTRUCTIONS
+}
+
+
+def chunk_frame(text: str) -> bytes:
+    """SSE chunk event: {"text": ...}."""
+    return CHUNK_PREFIX + orjson.dumps(text) + OBJECT_SUFFIX
+
+
+def error_frame(message: str) -> bytes:
+    """SSE error event: {"error": ...}."""
+    return ERROR_PREFIX + orjson.dumps(message) + OBJECT_SUFFIX
+
+
+def passages_frame(passages, mode: str | None = None) -> bytes:
+    """SSE passages event, tagged with the mode when one is given."""
+    payload = {'passages': passages} if mode is None else {'passages': passages, 'mode': mode}
+    return PASSAGES_PREFIX + orjson.dumps(payload) + EVENT_SUFFIX
+
+
+NO_PASSAGES_FRAME = error_frame('Could not find relevant passages')
+
+
+def _cached_answer_frames(cached, mode: str) -> bytes:
+    """Replay a semantic-cache hit as one passages, chunk and done event sequence."""
+    return (
+        passages_frame(cached['passages'], mode)
+        + chunk_frame(cached['answer'])
+        + MODE_DONE_FRAMES[mode]
+    )
+
+
+# LLM tokens are batched into one chunk event per window instead of one per token.
+SSE_COALESCE_CHARS = 256
+SSE_COALESCE_SECONDS = 0.016
+
+
+class _ChunkBuffer:
+    """Accumulates streamed text and emits a chunk frame once the window fills."""
+
+    __slots__ = ('_parts', '_size', '_last_flush')
+
+    def __init__(self):
+        self._parts = []
+        self._size = 0
+        self._last_flush = time.monotonic()
+
+    def add(self, text: str) -> bytes:
+        """Buffer text; returns a frame when the size or time window is exceeded, else b''."""
+        self._parts.append(text)
+        self._size += len(text)
+        now = time.monotonic()
+        if self._size >= SSE_COALESCE_CHARS or now - self._last_flush >= SSE_COALESCE_SECONDS:
+            return self.flush(now)
+        return b''
 
-# Book name variations mapping
-BOOK_NAME_VARIATIONS = {
+    def flush(self, now: float | None = None) -> bytes:
+        """Return a frame for whatever is buffered (b'' when empty)."""
+        self._last_flush = time.monotonic() if now is None else now
+        if not self._parts:
+            return b''
+        text = ''.join(self._parts)
+        self._parts.clear()
+        self._size = 0
+        return chunk_frame(text)
+
+# Book name variations mapping (read-only; consulted while building _CHAPTER_LOOKUP)
+BOOK_NAME_VARIATIONS = MappingProxyType({
     'psalm': 'psalms',
     'song of songs': 'song of solomon',
     '1 john': '1john',
@@ -51,7 +215,14 @@ BOOK_NAME_VARIATIONS = {
     '2 kings': '2kings',
     '1 chronicles': '1chronicles',
     '2 chronicles': '2chronicles',
-}
+})
+
+# Normalized book name -> every variation that maps onto it
+_VARIATIONS_BY_TARGET = {}
+for _alias, _target in BOOK_NAME_VARIATIONS.items():
+    _VARIATIONS_BY_TARGET.setdefault(_target, []).append(_alias)
+_VARIATIONS_BY_TARGET = MappingProxyType({target: tuple(aliases) for target, aliases in _VARIATIONS_BY_TARGET.items()})
+del _alias, _target
 
 def normalize_book_name(book_name):
     """Normalize book names to handle common variations."""
@@ -60,28 +231,32 @@ def normalize_book_name(book_name):
 
 def normalize_mode(mode_raw):
     """Ensure mode matches a supported focus option."""
-    if not mode_raw:
-        return DEFAULT_MODE
-    mode_key = str(mode_raw).strip().lower()
-    return mode_key if mode_key in MODE_INSTRUCTIONS else DEFAULT_MODE
+    return resolve_mode(mode_raw)
+
+def _init_rag():
+    """Open the RAG pipeline, returning None when it is not available."""
+    try:
+        pipeline = BibleRAG(
+            embed_keep_alive=OLLAMA_EMBED_KEEP_ALIVE,
+            llm_keep_alive=OLLAMA_LLM_KEEP_ALIVE
+        )
+        logger.info("✅ RAG pipeline initialized successfully")
+        return pipeline
+    except Exception as e:
+        logger.warning("⚠️  Warning: Could not initialize RAG pipeline: %s", e)
+        logger.warning("Make sure you've run 'python build_embeddings.py' first!")
+        return None
+
 
 # Initialize RAG pipeline
-try:
-    rag = BibleRAG(
-        embed_keep_alive=OLLAMA_EMBED_KEEP_ALIVE,
-        llm_keep_alive=OLLAMA_LLM_KEEP_ALIVE
-    )
-    print("✅ RAG pipeline initialized successfully", flush=True)
-except Exception as e:
-    print(f"⚠️  Warning: Could not initialize RAG pipeline: {e}", flush=True)
-    print("Make sure you've run 'python build_embeddings.py' first!", flush=True)
-    rag = None
+rag = _init_rag()
 
 
 @app.route('/')
 def index():
     """Serve the main page."""
-    return send_from_directory('static', 'index.html')
+    # Always revalidate the HTML shell so asset changes are picked up.
+    return send_from_directory('static', 'index.html', max_age=0)
 
 
 @app.route('/static/<path:path>')
@@ -126,40 +301,56 @@ def ask_question():
         }
     """
     if not rag:
-        return jsonify({
+        return _ojson({
             'error': 'RAG pipeline not initialized. Please run build_embeddings.py first.'
-        }), 500
+        }, 500)
     
     try:
         # Get question from request
-        data = request.get_json(silent=True) or {}
+        data = _read_json_body()
         question = data.get('question', '').strip()
         mode = normalize_mode(data.get('mode'))
         
         if not question:
-            return jsonify({
+            return _ojson({
                 'error': 'Question is required'
-            }), 400
+            }, 400)
+        
+        # Near-duplicate questions are answered from the semantic cache
+        embedding, cached = rag.lookup_answer(question, mode)
+        if cached:
+            return _ojson({
+                'answer': cached['answer'],
+                'passages': cached['passages'],
+                'mode': mode
+            })
         
-        # Get response from RAG pipeline
-        result = rag.ask(question, mode=mode)
+        # Get response from RAG pipeline; retrieval is micro-batched with concurrent requests
+        passages = rag.retrieval_batcher.submit(question, embedding)
+        result = rag.generate_response(question, passages, mode=mode)
         
         if result.get('error'):
-            return jsonify({
+            return _ojson({
                 'error': result['answer']
-            }), 500
+            }, 500)
+        
+        rag.remember_answer(embedding, mode, result['answer'], passages)
         
-        return jsonify({
+        return _ojson({
             'answer': result['answer'],
             'passages': result['passages'],
             'mode': mode
         })
         
+    except orjson.JSONDecodeError:
+        return _ojson({
+            'error': 'Request body must be valid JSON'
+        }, 400)
     except Exception as e:
-        print(f"Error processing question: {e}")
-        return jsonify({
+        logger.error("Error processing question: %s", e)
+        return _ojson({
             'error': f'An error occurred: {str(e)}'
-        }), 500
+        }, 500)
 
 
 @app.route('/api/ask-stream', methods=['POST'])
@@ -180,51 +371,66 @@ def ask_question_stream():
         - event: error - Error occurred
     """
     if not rag:
-        return jsonify({
+        return _ojson({
             'error': 'RAG pipeline not initialized. Please run build_embeddings.py first.'
-        }), 500
+        }, 500)
     
     try:
         # Get question from request
-        data = request.get_json(silent=True) or {}
+        data = _read_json_body()
         question = data.get('question', '').strip()
         mode = normalize_mode(data.get('mode'))
         
         if not question:
-            return jsonify({
+            return _ojson({
                 'error': 'Question is required'
-            }), 400
+            }, 400)
         
         def generate():
             """Generator function for SSE streaming."""
+            buffer = _ChunkBuffer()
             try:
                 # Retrieve relevant passages first
-                print(f"\n🙏 Question: {question}")
-                print("📖 Retrieving relevant Bible passages...")
-                passages = rag.retrieve_passages(question)
-                print(f"✅ Found {len(passages)} relevant passages")
+                logger.debug("🙏 Question: %s", question)
+                embedding, cached = rag.lookup_answer(question, mode)
+                if cached:
+                    logger.debug("✅ Answered from semantic cache")
+                    yield _cached_answer_frames(cached, mode)
+                    return
+                
+                logger.debug("📖 Retrieving relevant Bible passages...")
+                passages = rag.retrieval_batcher.submit(question, embedding)
+                logger.debug("✅ Found %s relevant passages", len(passages))
                 
                 # Send passages first so UI can display them
-                yield f"event: passages\ndata: {json.dumps({'passages': passages, 'mode': mode})}\n\n"
+                yield passages_frame(passages, mode)
                 
                 # Stream the response
-                print("🤖 Generating AI Jesus response (streaming)...")
+                logger.debug("🤖 Generating AI Jesus response (streaming)...")
+                answer_parts = []
                 for chunk_data in rag.generate_response_stream(question, passages, mode=mode):
                     if chunk_data.get('error'):
-                        yield f"event: error\ndata: {json.dumps({'error': chunk_data.get('chunk', 'Error occurred')})}\n\n"
+                        yield buffer.flush() + error_frame(chunk_data.get('chunk', 'Error occurred'))
                         break
                     elif chunk_data.get('chunk'):
-                        # Send text chunk
-                        yield f"event: chunk\ndata: {json.dumps({'text': chunk_data['chunk']})}\n\n"
+                        # Send text chunks, coalesced
+                        answer_parts.append(chunk_data['chunk'])
+                        frame = buffer.add(chunk_data['chunk'])
+                        if frame:
+                            yield frame
                     
                     if chunk_data.get('done'):
-                        yield f"event: done\ndata: {json.dumps({'done': True, 'mode': mode})}\n\n"
-                        print("✅ Response generated")
+                        yield buffer.flush() + MODE_DONE_FRAMES[mode]
+                        rag.remember_answer(embedding, mode, ''.join(answer_parts).strip(), passages)
+                        logger.debug("✅ Response generated")
                         break
+                else:
+                    # Stream ended without a done marker; don't drop buffered text
+                    yield buffer.flush()
                         
             except Exception as e:
-                print(f"Error in streaming: {e}")
-                yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+                logger.error("Error in streaming: %s", e)
+                yield buffer.flush() + error_frame(str(e))
         
         return Response(
             stream_with_context(generate()),
@@ -235,11 +441,15 @@ def ask_question_stream():
             }
         )
         
+    except orjson.JSONDecodeError:
+        return _ojson({
+            'error': 'Request body must be valid JSON'
+        }, 400)
     except Exception as e:
-        print(f"Error processing streaming question: {e}")
-        return jsonify({
+        logger.error("Error processing streaming question: %s", e)
+        return _ojson({
             'error': f'An error occurred: {str(e)}'
-        }), 500
+        }, 500)
 
 
 @app.route('/api/study', methods=['POST'])
@@ -253,33 +463,37 @@ def generate_study():
         }
     """
     if not rag:
-        return jsonify({
+        return _ojson({
             'error': 'RAG pipeline not initialized.'
-        }), 500
+        }, 500)
     
     try:
-        data = request.get_json(silent=True) or {}
+        data = _read_json_body()
         topic = data.get('topic', '').strip()
         
         if not topic:
-            return jsonify({
+            return _ojson({
                 'error': 'Topic is required'
-            }), 400
+            }, 400)
         
         result = rag.generate_study(topic)
         
         if result.get('error'):
-            return jsonify({
+            return _ojson({
                 'error': result['study']
-            }), 500
+            }, 500)
         
-        return jsonify(result)
+        return _ojson(result)
         
+    except orjson.JSONDecodeError:
+        return _ojson({
+            'error': 'Request body must be valid JSON'
+        }, 400)
     except Exception as e:
-        print(f"Error generating study: {e}")
-        return jsonify({
+        logger.error("Error generating study: %s", e)
+        return _ojson({
             'error': f'An error occurred: {str(e)}'
-        }), 500
+        }, 500)
 
 
 @app.route('/api/prayer', methods=['POST'])
@@ -293,33 +507,37 @@ def generate_prayer():
         }
     """
     if not rag:
-        return jsonify({
+        return _ojson({
             'error': 'RAG pipeline not initialized.'
-        }), 500
+        }, 500)
     
     try:
-        data = request.get_json(silent=True) or {}
+        data = _read_json_body()
         req_text = data.get('request', '').strip()
         
         if not req_text:
-            return jsonify({
+            return _ojson({
                 'error': 'Prayer request is required'
-            }), 400
+            }, 400)
         
         result = rag.generate_prayer(req_text)
         
         if result.get('error'):
-            return jsonify({
+            return _ojson({
                 'error': result['prayer']
-            }), 500
+            }, 500)
         
-        return jsonify(result)
+        return _ojson(result)
         
+    except orjson.JSONDecodeError:
+        return _ojson({
+            'error': 'Request body must be valid JSON'
+        }, 400)
     except Exception as e:
-        print(f"Error generating prayer: {e}")
-        return jsonify({
+        logger.error("Error generating prayer: %s", e)
+        return _ojson({
             'error': f'An error occurred: {str(e)}'
-        }), 500
+        }, 500)
 
 
 @app.route('/api/study-stream', methods=['POST'])
@@ -329,74 +547,64 @@ def generate_study_stream():
     Uses Server-Sent Events (SSE) to stream the response.
     """
     if not rag:
-        return jsonify({
+        return _ojson({
             'error': 'RAG pipeline not initialized.'
-        }), 500
+        }, 500)
     
     try:
-        data = request.get_json(silent=True) or {}
+        data = _read_json_body()
         topic = data.get('topic', '').strip()
         
         if not topic:
-            return jsonify({
+            return _ojson({
                 'error': 'Topic is required'
-            }), 400
+            }, 400)
         
         def generate():
             """Generator function for SSE streaming."""
+            buffer = _ChunkBuffer()
             try:
                 # Retrieve relevant passages first
-                print(f"\n📚 Bible Study Topic: {topic}")
-                print("📖 Retrieving relevant passages...")
+                logger.debug("📚 Bible Study Topic: %s", topic)
+                logger.debug("📖 Retrieving relevant passages...")
                 passages = rag.retrieve_passages(topic)
-                print(f"✅ Found {len(passages)} relevant passages")
+                logger.debug("✅ Found %s relevant passages", len(passages))
                 
                 if not passages:
-                    yield f"event: error\ndata: {json.dumps({'error': 'Could not find relevant passages'})}\n\n"
+                    yield NO_PASSAGES_FRAME
                     return
                 
                 # Send passages first
-                yield f"event: passages\ndata: {json.dumps({'passages': passages})}\n\n"
+                yield passages_frame(passages)
                 
-                # Build the study prompt
-                context = "Here are relevant passages:\n\n"
-                for i, passage in enumerate(passages, 1):
-                    context += f"{i}. {passage['reference']}:\n\"{passage['text']}\"\n\n"
-                    
-                prompt = f"""You are AI Jesus, a wise teacher. Create a short Bible study on the topic: "{topic}".
-        
-{context}
-
-Structure the study as follows:
-1. **Introduction**: Briefly introduce the topic.
-2. **Key Verses**: Discuss 2-3 of the provided verses and their meaning.
-3. **Reflection**: Ask 2-3 questions to help the reader apply this to their life.
-4. **Prayer**: A short closing prayer.
-
-Keep the tone encouraging and insightful.
-"""
+                prompt = rag.build_study_prompt(topic, passages)
                 
                 # Stream the response
-                print("🤖 Generating Bible study (streaming)...")
-                stream = ollama.generate(
-                    model=rag.llm_model if rag else 'gemma3:4b',
+                logger.debug("🤖 Generating Bible study (streaming)...")
+                stream = ollama_client().generate(
+                    model=rag.llm_model if rag else DEFAULT_LLM_MODEL,
                     prompt=prompt,
                     stream=True,
-                    options={'temperature': 0.7},
+                    options=STUDY_OPTIONS,
                     keep_alive=OLLAMA_LLM_KEEP_ALIVE
                 )
                 
                 for chunk in stream:
                     if chunk.get('response'):
-                        yield f"event: chunk\ndata: {json.dumps({'text': chunk['response']})}\n\n"
+                        frame = buffer.add(chunk['response'])
+                        if frame:
+                            yield frame
                     if chunk.get('done'):
-                        yield f"event: done\ndata: {json.dumps({'done': True})}\n\n"
-                        print("✅ Bible study generated")
+                        yield buffer.flush() + DONE_FRAME
+                        logger.debug("✅ Bible study generated")
                         break
+                else:
+                    # Stream ended without a done marker; don't drop buffered text
+                    yield buffer.flush()
                         
             except Exception as e:
-                print(f"Error in streaming study: {e}")
-                yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+                logger.error("Error in streaming study: %s", e)
+                yield buffer.flush() + error_frame(str(e))
         
         return Response(
             stream_with_context(generate()),
@@ -407,11 +615,15 @@ Keep the tone encouraging and insightful.
             }
         )
         
+    except orjson.JSONDecodeError:
+        return _ojson({
+            'error': 'Request body must be valid JSON'
+        }, 400)
     except Exception as e:
-        print(f"Error processing streaming study: {e}")
-        return jsonify({
+        logger.error("Error processing streaming study: %s", e)
+        return _ojson({
             'error': f'An error occurred: {str(e)}'
-        }), 500
+        }, 500)
 
 
 @app.route('/api/prayer-stream', methods=['POST'])
@@ -421,70 +633,60 @@ def generate_prayer_stream():
     Uses Server-Sent Events (SSE) to stream the response.
     """
     if not rag:
-        return jsonify({
+        return _ojson({
             'error': 'RAG pipeline not initialized.'
-        }), 500
+        }, 500)
     
     try:
-        data = request.get_json(silent=True) or {}
+        data = _read_json_body()
         req_text = data.get('request', '').strip()
         
         if not req_text:
-            return jsonify({
+            return _ojson({
                 'error': 'Prayer request is required'
-            }), 400
+            }, 400)
         
         def generate():
             """Generator function for SSE streaming."""
+            buffer = _ChunkBuffer()
             try:
                 # Retrieve relevant passages first
-                print(f"\n🙏 Prayer Request: {req_text}")
-                print("📖 Retrieving relevant passages...")
+                logger.debug("🙏 Prayer Request: %s", req_text)
+                logger.debug("📖 Retrieving relevant passages...")
                 passages = rag.retrieve_passages(req_text)
-                print(f"✅ Found {len(passages)} relevant passages")
+                logger.debug("✅ Found %s relevant passages", len(passages))
                 
                 # Send passages (even if empty)
-                yield f"event: passages\ndata: {json.dumps({'passages': passages[:3]})}\n\n"
-                
-                # Build the prayer prompt
-                context = ""
-                if passages:
-                    context = "Here are some relevant verses to inspire the prayer:\n\n"
-                    for i, passage in enumerate(passages[:3], 1):
-                        context += f"{i}. {passage['reference']}:\n\"{passage['text']}\"\n\n"
+                yield passages_frame(passages[:3])
                 
-                prompt = f"""You are AI Jesus. A user has asked for prayer: "{req_text}".
-        
-{context}
-
-Write a heartfelt, comforting prayer for them. 
-- Address their specific situation.
-- Weave in the themes from the verses if applicable.
-- Keep it under 150 words.
-- End with "Amen."
-"""
+                prompt = rag.build_prayer_prompt(req_text, passages)
                 
                 # Stream the response
-                print("🤖 Generating prayer (streaming)...")
-                stream = ollama.generate(
-                    model=rag.llm_model if rag else 'gemma3:4b',
+                logger.debug("🤖 Generating prayer (streaming)...")
+                stream = ollama_client().generate(
+                    model=rag.llm_model if rag else DEFAULT_LLM_MODEL,
                     prompt=prompt,
                     stream=True,
-                    options={'temperature': 0.8},
+                    options=PRAYER_OPTIONS,
                     keep_alive=OLLAMA_LLM_KEEP_ALIVE
                 )
                 
                 for chunk in stream:
                     if chunk.get('response'):
-                        yield f"event: chunk\ndata: {json.dumps({'text': chunk['response']})}\n\n"
+                        frame = buffer.add(chunk['response'])
+                        if frame:
+                            yield frame
                     if chunk.get('done'):
-                        yield f"event: done\ndata: {json.dumps({'done': True})}\n\n"
-                        print("✅ Prayer generated")
+                        yield buffer.flush() + DONE_FRAME
+                        logger.debug("✅ Prayer generated")
                         break
+                else:
+                    # Stream ended without a done marker; don't drop buffered text
+                    yield buffer.flush()
                         
             except Exception as e:
-                print(f"Error in streaming prayer: {e}")
-                yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+                logger.error("Error in streaming prayer: %s", e)
+                yield buffer.flush() + error_frame(str(e))
         
         return Response(
             stream_with_context(generate()),
@@ -495,18 +697,30 @@ Write a heartfelt, comforting prayer for them.
             }
         )
         
+    except orjson.JSONDecodeError:
+        return _ojson({
+            'error': 'Request body must be valid JSON'
+        }, 400)
     except Exception as e:
-        print(f"Error processing streaming prayer: {e}")
-        return jsonify({
+        logger.error("Error processing streaming prayer: %s", e)
+        return _ojson({
             'error': f'An error occurred: {str(e)}'
-        }), 500
+        }, 500)
 
 
 @app.route('/api/bible-index', methods=['GET'])
 def get_bible_index():
     """Return the structure of the Bible library."""
-    index = build_bible_index()
-    return jsonify({'testaments': index})
+    if request.accept_encodings['gzip']:
+        # Already compressed; flask-compress skips responses with a Content-Encoding.
+        response = Response(_BIBLE_INDEX_GZIP, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+        etag = f'{_BIBLE_INDEX_ETAG}-gzip'
+    else:
+        response = Response(_BIBLE_INDEX_BYTES, mimetype='application/json')
+        etag = _BIBLE_INDEX_ETAG
+    response.vary.add('Accept-Encoding')
+    return _cacheable(response, etag)
 
 
 @app.route('/api/bible-passage', methods=['GET'])
@@ -529,42 +743,59 @@ def get_bible_passage():
     
     if relative_path:
         try:
-            chapter_path = resolve_bible_path(relative_path)
+            chapter_path = resolve_bible_path(relative_path, BIBLE_DATA_DIR)
         except FileNotFoundError:
-            return jsonify({'error': 'Bible passage not found'}), 404
+            return _ojson({'error': 'Bible passage not found'}, 404)
         except ValueError:
-            return jsonify({'error': 'Invalid bible path provided'}), 400
+            return _ojson({'error': 'Invalid bible path provided'}, 400)
     else:
         if not book_param or chapter_param is None:
-            return jsonify({
+            return _ojson({
                 'error': 'Provide either a bible path or both book and chapter parameters.'
-            }), 400
+            }, 400)
         try:
-            chapter_path, relative_path, _, _ = _find_chapter_markdown(book_param, chapter_param)
+            chapter_path, relative_path, _, _ = _find_chapter_markdown(book_param.lower(), chapter_param)
         except FileNotFoundError:
-            return jsonify({
+            return _ojson({
                 'error': f'Bible passage not found for {book_param} {chapter_param}'
-            }), 404
-        except ValueError as exc:
-            return jsonify({'error': str(exc)}), 400
-
-    with open(chapter_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+            }, 404)
 
-    verses = parse_verses(content)
+    verses = _load_chapter(str(chapter_path))[0]
     book, testament, chapter = _derive_metadata_from_path(relative_path)
 
-    return jsonify({
+    header = {
         'book': book,
         'testament': testament,
         'chapter': chapter,
         'path': relative_path,
-        'verses': [{'number': v_num, 'text': v_text} for v_num, v_text in verses],
         'highlight': {
             'start': start,
             'end': end
         }
-    })
+    }
+
+    if len(verses) <= PASSAGE_STREAM_MIN_VERSES:
+        header['verses'] = [{'number': v_num, 'text': v_text} for v_num, v_text in verses]
+        return Response(orjson.dumps(header), mimetype='application/json')
+
+    return Response(_stream_passage_json(header, verses), mimetype='application/json')
+
+
+def _stream_passage_json(header, verses):
+    """Write a passage payload incrementally so long chapters are never built as one string."""
+    # Re-open the serialized header object to append the verses array.
+    yield orjson.dumps(header)[:-1] + b',"verses":['
+    for offset in range(0, len(verses), PASSAGE_STREAM_BATCH):
+        batch = b','.join(
+            orjson.dumps({'number': v_num, 'text': v_text})
+            for v_num, v_text in verses[offset:offset + PASSAGE_STREAM_BATCH]
+        )
+        yield batch if offset == 0 else b',' + batch
+    yield b']}'
+
+
+class VersesNotFound(Exception):
+    """No verse of the requested range exists in the chapter."""
 
 
 @app.route('/api/verse-preview', methods=['GET'])
@@ -584,48 +815,66 @@ def get_verse_preview():
     verse_end = _safe_int(request.args.get('verse_end'))
     
     if not book or chapter_num is None or verse_start is None:
-        return jsonify({'error': 'book, chapter, and verse_start are required'}), 400
+        return _ojson({'error': 'book, chapter, and verse_start are required'}, 400)
     
     if verse_end is None:
         verse_end = verse_start
     
     try:
-        chapter_path, _, canonical_book_name, _ = _find_chapter_markdown(book, chapter_num)
+        chapter_path, _, canonical_book_name, _ = _find_chapter_markdown(book.lower(), chapter_num)
     except FileNotFoundError:
-        return jsonify({'error': f'Chapter not found: {book} {chapter_raw or chapter_num}'}), 404
-    except ValueError as exc:
-        return jsonify({'error': str(exc)}), 400
+        return _ojson({'error': f'Chapter not found: {book} {chapter_raw or chapter_num}'}, 404)
     
     try:
-        with open(chapter_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        verses = parse_verses(content)
-        
-        selected_verses = []
-        for verse_num, verse_text in verses:
-            verse_number = _safe_int(verse_num)
-            if verse_number is None:
-                continue
-            if verse_start <= verse_number <= verse_end:
-                selected_verses.append(f"{verse_number}. {verse_text}")
-        
-        if not selected_verses:
-            return jsonify({
-                'error': f'Verses not found: {book} {chapter_num}:{verse_start}-{verse_end}'
-            }), 404
-        
-        return jsonify({
-            'book': canonical_book_name or book,
-            'chapter': chapter_num,
-            'verse_start': verse_start,
-            'verse_end': verse_end,
-            'text': ' '.join(selected_verses)
-        })
-        
+        payload, etag = _render_verse_preview(
+            str(chapter_path), canonical_book_name or book, chapter_num, verse_start, verse_end
+        )
+    except VersesNotFound:
+        return _ojson({
+            'error': f'Verses not found: {book} {chapter_num}:{verse_start}-{verse_end}'
+        }, 404)
     except Exception as e:
-        print(f"Error fetching verse preview: {e}")
-        return jsonify({'error': 'Failed to fetch verse'}), 500
+        logger.error("Error fetching verse preview: %s", e)
+        return _ojson({'error': 'Failed to fetch verse'}, 500)
+
+    return _cacheable(Response(payload, mimetype='application/json'), etag)
+
+
+@lru_cache(maxsize=4096)
+def _render_verse_preview(chapter_path: str, book_name: str, chapter_num: int, verse_start: int, verse_end: int):
+    """
+    Build the verse-preview JSON once per reference and return (payload, etag).
+    Tooltip hovers cluster on a few popular verses, so repeats are a cache hit.
+    Raises VersesNotFound (which is not cached) when no verse falls in the range.
+    """
+    _, verses_by_num, last_verse, dense_texts = _load_chapter(chapter_path)
+    
+    first = max(verse_start, 1)
+    if dense_texts is not None:
+        # Verse n lives at index n - 1, so the range is a plain slice.
+        text = ' '.join(
+            f"{verse_number}. {verse_text}"
+            for verse_number, verse_text in enumerate(dense_texts[first - 1:max(verse_end, 0)], first)
+        )
+    else:
+        text = ' '.join(
+            f"{verse_number}. {verses_by_num[verse_number]}"
+            for verse_number in range(first, min(verse_end, last_verse) + 1)
+            if verse_number in verses_by_num
+        )
+    
+    # Every selected verse renders as at least "n. ", so empty means nothing matched.
+    if not text:
+        raise VersesNotFound(f'{book_name} {chapter_num}:{verse_start}-{verse_end}')
+    
+    payload = orjson.dumps({
+        'book': book_name,
+        'chapter': chapter_num,
+        'verse_start': verse_start,
+        'verse_end': verse_end,
+        'text': text
+    })
+    return payload, hashlib.blake2b(payload, digest_size=8).hexdigest()
 
 
 @app.route('/api/health', methods=['GET'])
@@ -644,73 +893,178 @@ def health_check():
         except:
             status['passages_count'] = 0
     
-    return jsonify(status)
+    return _ojson(status)
 
 
 @app.errorhandler(404)
 def not_found(e):
     """Handle 404 errors."""
-    return jsonify({'error': 'Not found'}), 404
+    return _ojson({'error': 'Not found'}, 404)
 
 
 @app.errorhandler(500)
 def server_error(e):
     """Handle 500 errors."""
-    return jsonify({'error': 'Internal server error'}), 500
+    return _ojson({'error': 'Internal server error'}, 500)
+
+
+def _ojson(obj, status: int = 200):
+    """Serialize a JSON response with orjson, skipping Flask's JSON provider."""
+    return Response(orjson.dumps(obj, option=_ORJSON_OPTIONS), status=status, mimetype='application/json')
+
+
+def _cacheable(response, etag: str, max_age: int = CORPUS_MAX_AGE):
+    """
+    Mark a response as publicly cacheable under a strong ETag and answer
+    If-None-Match revalidation with a bodiless 304.
+    """
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response.make_conditional(request)
+
+
+def _read_json_body():
+    """
+    Decode a JSON request body with orjson without caching it on the request.
+    Returns an empty dict for empty or non-object bodies; raises orjson.JSONDecodeError
+    on malformed input.
+    """
+    raw = request.get_data(cache=False)
+    if not raw:
+        return {}
+    data = orjson.loads(raw)
+    return data if isinstance(data, dict) else {}
 
 
 def _safe_int(value):
     """Convert a value to int when possible."""
-    try:
-        if value is None or value == '':
+    if value is None or value == '':
+        return None
+    if value.__class__ is int:
+        return value
+    # Plain digit strings are the common query-param case; int() accepts every
+    # str.isdecimal() string, so this path never raises.
+    if value.__class__ is str:
+        if value.isdecimal():
+            return int(value)
+        text = value.strip()
+        digits = text[1:] if text[:1] in ('+', '-') else text
+        if digits.isdecimal():
+            return int(text)
+        # Anything else int() would reject too, short of '1_000' style literals,
+        # so junk input is turned away without raising.
+        if '_' not in digits:
             return None
+    try:
         return int(value)
     except (TypeError, ValueError):
         return None
 
 
+@lru_cache(maxsize=KJV_CHAPTER_COUNT)
+def _load_chapter(path_str: str):
+    """
+    Parse a chapter once, from the preloaded text when available.
+    Returns (verses, verses_by_num, last_verse, dense_texts) where verses is an
+    immutable tuple of (verse_number, text) pairs in file order, verses_by_num
+    maps each verse number to its text, and dense_texts holds just the texts
+    when the chapter is numbered 1..N in order (None otherwise) so ranges can
+    be sliced instead of looked up verse by verse.
+    """
+    content = _CHAPTER_TEXT.get(path_str)
+    if content is None:
+        with open(path_str, 'rb') as f:
+            content = f.read()
+    verses = tuple(parse_verses(content))
+    verses_by_num = dict(verses)
+    last_verse = max(verses_by_num, default=0)
+    is_dense = all(verse_num == index for index, (verse_num, _) in enumerate(verses, 1))
+    dense_texts = tuple(verse_text for _, verse_text in verses) if is_dense else None
+    return verses, verses_by_num, last_verse, dense_texts
+
+
 def _derive_metadata_from_path(relative_path: str):
     """Derive (book, testament, chapter) from a bible-data relative path."""
-    path = Path(relative_path)
-    parts = path.parts
-    testament = parts[0] if parts else ""
+    cached = _PATH_METADATA.get(relative_path)
+    if cached is not None:
+        return cached
+    parts = relative_path.replace('\\', '/').split('/')
+    testament = parts[0]
     book_folder = parts[1] if len(parts) > 1 else ""
     book = extract_book_name(book_folder)
-    chapter = extract_chapter_number(path.name)
+    chapter = extract_chapter_number(parts[-1])
     return book, testament, chapter
 
 
-def _find_chapter_markdown(book: str, chapter: int):
-    """Locate a chapter markdown file using a book/chapter reference."""
-    normalized_book = normalize_book_name(book)
-    if not normalized_book:
-        raise ValueError('A valid book name is required to locate a passage.')
-    
-    chapter_num = _safe_int(chapter)
-    if chapter_num is None:
-        raise ValueError('A valid chapter number is required to locate a passage.')
-    
-    for testament in ('Old Testament', 'New Testament'):
-        testament_dir = BIBLE_DATA_DIR / testament
-        if not testament_dir.exists():
-            continue
-        
-        for book_dir in testament_dir.iterdir():
-            if not book_dir.is_dir():
-                continue
-            
-            book_name = extract_book_name(book_dir.name)
-            if normalize_book_name(book_name) != normalized_book:
-                continue
-            
-            for chapter_file in sorted(book_dir.glob('*.md')):
-                file_chapter = _safe_int(extract_chapter_number(chapter_file))
-                if file_chapter == chapter_num:
-                    absolute_path = chapter_file.resolve()
-                    relative_path = absolute_path.relative_to(BIBLE_DATA_DIR).as_posix()
-                    return absolute_path, relative_path, book_name, testament
-    
-    raise FileNotFoundError(f'Chapter not found: {book} {chapter}')
+def _book_aliases(book_name: str, folder_name: str):
+    """List every lowercase spelling that should resolve to a book folder."""
+    normalized = normalize_book_name(book_name)
+    aliases = [book_name.lower().strip(), normalized, folder_name.lower()]
+    aliases.extend(_VARIATIONS_BY_TARGET.get(normalized, ()))
+    return list(dict.fromkeys(aliases))
+
+
+def _build_chapter_index(bible_index, bible_dir: Path = BIBLE_DATA_DIR):
+    """
+    Flatten the bible index into the lookup tables used by _find_chapter_markdown.
+    Returns (chapter_lookup, path_metadata):
+        chapter_lookup - (book alias, chapter) -> (path, relative path, book, testament)
+        path_metadata  - relative path -> (book, testament, chapter)
+    """
+    chapter_lookup = {}
+    path_metadata = {}
+
+    for testament_data in bible_index:
+        testament = testament_data['name']
+        for book_data in testament_data['books']:
+            book_name = book_data['name']
+            aliases = _book_aliases(book_name, book_data['folder'])
+            for chapter_data in book_data['chapters']:
+                relative_path = chapter_data['path']
+                path_metadata[relative_path] = (book_name, testament, chapter_data['number'])
+                details = (bible_dir / relative_path, relative_path, book_name, testament)
+                chapter_num = _safe_int(chapter_data['number'])
+                for alias in aliases:
+                    chapter_lookup.setdefault((alias, chapter_num), details)
+
+    return chapter_lookup, path_metadata
+
+
+def _preload_chapter_text(chapter_lookup):
+    """
+    Read every indexed chapter into memory, keyed by the path string _load_chapter receives.
+    The KJV corpus is only a few MB, so the request path never has to open a file.
+    """
+    chapter_text = {}
+    for chapter_path, _, _, _ in chapter_lookup.values():
+        path_str = str(chapter_path)
+        if path_str not in chapter_text:
+            with open(path_str, 'rb') as f:
+                chapter_text[path_str] = f.read().decode('utf-8')
+    return chapter_text
+
+
+def _find_chapter_markdown(book_key: str, chapter: int):
+    """
+    Locate a chapter markdown file using a book/chapter reference.
+    Callers validate the request and pass the book already stripped and
+    lowercased, so the lookup does no string work of its own.
+    """
+    entry = _CHAPTER_LOOKUP.get((book_key, chapter))
+    if entry is None:
+        raise FileNotFoundError(f'Chapter not found: {book_key} {chapter}')
+    return entry
+
+
+# Chapter lookups are served from memory; bible-data is static per deploy.
+BIBLE_INDEX = build_bible_index(BIBLE_DATA_DIR)
+_CHAPTER_LOOKUP, _PATH_METADATA = _build_chapter_index(BIBLE_INDEX)
+_CHAPTER_TEXT = _preload_chapter_text(_CHAPTER_LOOKUP)
+_BIBLE_INDEX_BYTES = orjson.dumps({'testaments': BIBLE_INDEX})
+_BIBLE_INDEX_ETAG = hashlib.blake2b(_BIBLE_INDEX_BYTES, digest_size=12).hexdigest()
+# Compressed once at startup (mtime=0 keeps the bytes reproducible across workers).
+_BIBLE_INDEX_GZIP = gzip.compress(_BIBLE_INDEX_BYTES, compresslevel=9, mtime=0)
 
 
 @app.route('/sitemap.xml')
@@ -718,9 +1072,25 @@ def sitemap():
     """
     Generate dynamic XML sitemap for SEO.
     Includes main pages and all Bible books/chapters.
+    Only <lastmod> changes day to day, so the XML is built once per day.
     """
-    base_url = 'https://wwaijd.org'
     today = datetime.now().strftime('%Y-%m-%d')
+    if _SITEMAP_CACHE['date'] != today:
+        sitemap_bytes = _build_sitemap(today)
+        _SITEMAP_CACHE['bytes'] = sitemap_bytes
+        _SITEMAP_CACHE['etag'] = hashlib.blake2b(sitemap_bytes, digest_size=12).hexdigest()
+        _SITEMAP_CACHE['date'] = today
+    
+    response = Response(_SITEMAP_CACHE['bytes'], mimetype='application/xml')
+    return _cacheable(response, _SITEMAP_CACHE['etag'], SITEMAP_MAX_AGE)
+
+
+_SITEMAP_CACHE = {'bytes': None, 'etag': None, 'date': None}
+
+
+def _build_sitemap(today: str) -> bytes:
+    """Render the sitemap XML for the given lastmod date."""
+    base_url = 'https://wwaijd.org'
     
     # Start XML
     xml = ['<?xml version="1.0" encoding="UTF-8"?>']
@@ -743,16 +1113,14 @@ def sitemap():
     
     # Bible books and chapters
     try:
-        bible_index = build_bible_index(BIBLE_DATA_DIR)
-        # bible_index is a list of testament dicts
-        for testament_data in bible_index:
+        # BIBLE_INDEX is a list of testament dicts
+        for testament_data in BIBLE_INDEX:
             for book_data in testament_data['books']:
-                book_name = book_data['name']
+                # URL encode book name
+                safe_book = book_data['name'].replace(' ', '%20')
                 # Use the actual chapters list from the index
                 for chapter_data in book_data['chapters']:
                     chapter_num = chapter_data['number']
-                    # URL encode book name
-                    safe_book = book_name.replace(' ', '%20')
                     xml.append('  <url>')
                     xml.append(f'    <loc>{base_url}/static/passage.html?book={safe_book}&amp;chapter={chapter_num}</loc>')
                     xml.append(f'    <lastmod>{today}</lastmod>')
@@ -760,11 +1128,11 @@ def sitemap():
                     xml.append('    <priority>0.6</priority>')
                     xml.append('  </url>')
     except Exception as e:
-        print(f"Warning: Could not generate Bible URLs for sitemap: {e}", flush=True)
+        logger.warning("Warning: Could not generate Bible URLs for sitemap: %s", e)
     
     xml.append('</urlset>')
     
-    return Response('\n'.join(xml), mimetype='application/xml')
+    return '\n'.join(xml).encode('utf-8')
 
 
 def main():
@@ -778,13 +1146,51 @@ def main():
         print("Please run 'python build_embeddings.py' first to create the vector database.", flush=True)
         print("=" * 60, flush=True)
     
-    print("\n🚀 Starting production server with Waitress...", flush=True)
-    print("📍 Open your browser to: http://localhost:5000", flush=True)
+    use_gunicorn = SERVER_WORKERS > 1 and os.name != 'nt'
+    server_name = f"gunicorn ({SERVER_WORKERS} workers)" if use_gunicorn else "Waitress"
+    print(f"\n🚀 Starting production server with {server_name}...", flush=True)
+    print(f"📍 Open your browser to: http://localhost:{SERVER_PORT}", flush=True)
     print("\nPress Ctrl+C to stop the server", flush=True)
     print("=" * 60 + "\n", flush=True)
     
+    if use_gunicorn:
+        try:
+            _serve_gunicorn(SERVER_WORKERS, SERVER_THREADS)
+            return
+        except ImportError:
+            print("⚠️  gunicorn is not installed; falling back to Waitress.", flush=True)
+    
     # Run with Waitress production server
-    serve(app, host='0.0.0.0', port=5000, threads=4)
+    serve(app, host=SERVER_HOST, port=SERVER_PORT, threads=SERVER_THREADS)
+
+
+def _serve_gunicorn(workers: int, threads: int):
+    """
+    Run the app under gunicorn threaded workers so requests scale across CPU cores.
+    The app is preloaded so the bible index and chapter caches are shared
+    copy-on-write; each worker reopens its own RAG pipeline after forking
+    because the ChromaDB SQLite handle is not fork-safe.
+    """
+    from gunicorn.app.base import BaseApplication
+
+    def post_fork(server, worker):
+        global rag
+        _configure_logging()
+        rag = _init_rag()
+
+    class WWAIJDApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{SERVER_HOST}:{SERVER_PORT}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('preload_app', True)
+            self.cfg.set('post_fork', post_fork)
+
+        def load(self):
+            return app
+
+    WWAIJDApplication().run()
 
 
 if __name__ == '__main__':
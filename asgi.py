@@ -0,0 +1,325 @@
+"""
+ASGI entrypoint for What Would AI Jesus Do
+Serves the SSE routes (/api/ask-stream, /api/study-stream, /api/prayer-stream)
+natively async so a long LLM stream parks on the event loop instead of pinning
+a server thread. Every other route is delegated to the Flask app unchanged.
+
+Run with: python asgi.py  (or uvicorn asgi:app --host 0.0.0.0 --port 5000)
+"""
+
+import asyncio
+import logging
+
+import orjson
+from asgiref.wsgi import WsgiToAsgi
+
+import app as wsgi
+from app import (
+    normalize_mode,
+    error_frame,
+    passages_frame,
+    DONE_FRAME,
+    MODE_DONE_FRAMES,
+    NO_PASSAGES_FRAME,
+    OLLAMA_LLM_KEEP_ALIVE,
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_WORKERS,
+    PRAYER_OPTIONS,
+    STUDY_OPTIONS,
+    _ChunkBuffer,
+    _cached_answer_frames,
+)
+
+logger = logging.getLogger(__name__)
+flask_app = WsgiToAsgi(wsgi.app)
+
+SSE_HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+]
+
+# Routes served natively on the event loop; anything else goes through Flask.
+ASYNC_ROUTES = {}
+
+
+async def app(scope, receive, send):
+    """ASGI application: native async streaming routes, Flask for the rest."""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+
+    handler = None
+    if scope['type'] == 'http' and scope['method'] == 'POST':
+        handler = ASYNC_ROUTES.get(scope['path'])
+
+    if handler is None:
+        await flask_app(scope, receive, send)
+    else:
+        await handler(scope, receive, send)
+
+
+async def ask_question_stream(scope, receive, send):
+    """
+    Async twin of app.ask_question_stream with the same SSE events.
+    Invalid requests are replayed to the Flask view so error responses stay
+    identical between the WSGI and ASGI servers.
+    """
+    body = await _read_body(receive)
+    rag = wsgi.rag
+    data = _json_object(body) if rag else None
+    question = _text_field(data, 'question')
+
+    if not question:
+        await flask_app(scope, _replay(body, receive), send)
+        return
+
+    mode = normalize_mode(data.get('mode'))
+    await _stream_sse(_ask_events(rag, question, mode), receive, send)
+
+
+async def study_stream(scope, receive, send):
+    """Async twin of app.generate_study_stream."""
+    body = await _read_body(receive)
+    rag = wsgi.rag
+    topic = _text_field(_json_object(body) if rag else None, 'topic')
+
+    if not topic:
+        await flask_app(scope, _replay(body, receive), send)
+        return
+
+    await _stream_sse(_study_events(rag, topic), receive, send)
+
+
+async def prayer_stream(scope, receive, send):
+    """Async twin of app.generate_prayer_stream."""
+    body = await _read_body(receive)
+    rag = wsgi.rag
+    req_text = _text_field(_json_object(body) if rag else None, 'request')
+
+    if not req_text:
+        await flask_app(scope, _replay(body, receive), send)
+        return
+
+    await _stream_sse(_prayer_events(rag, req_text), receive, send)
+
+
+ASYNC_ROUTES['/api/ask-stream'] = ask_question_stream
+ASYNC_ROUTES['/api/study-stream'] = study_stream
+ASYNC_ROUTES['/api/prayer-stream'] = prayer_stream
+
+
+async def _ask_events(rag, question, mode):
+    """Async generator yielding the SSE frames for one question."""
+    buffer = _ChunkBuffer()
+    try:
+        logger.debug("🙏 Question: %s", question)
+        embedding, cached = await asyncio.to_thread(rag.lookup_answer, question, mode)
+        if cached:
+            logger.debug("✅ Answered from semantic cache")
+            yield _cached_answer_frames(cached, mode)
+            return
+
+        logger.debug("📖 Retrieving relevant Bible passages...")
+        passages = await asyncio.to_thread(rag.retrieval_batcher.submit, question, embedding)
+        logger.debug("✅ Found %s relevant passages", len(passages))
+
+        yield passages_frame(passages, mode)
+
+        logger.debug("🤖 Generating AI Jesus response (streaming)...")
+        answer_parts = []
+        async for chunk_data in rag.generate_response_astream(question, passages, mode=mode):
+            if chunk_data.get('error'):
+                yield buffer.flush() + error_frame(chunk_data.get('chunk', 'Error occurred'))
+                break
+            elif chunk_data.get('chunk'):
+                answer_parts.append(chunk_data['chunk'])
+                frame = buffer.add(chunk_data['chunk'])
+                if frame:
+                    yield frame
+
+            if chunk_data.get('done'):
+                yield buffer.flush() + MODE_DONE_FRAMES[mode]
+                rag.remember_answer(embedding, mode, ''.join(answer_parts).strip(), passages)
+                logger.debug("✅ Response generated")
+                break
+        else:
+            # Stream ended without a done marker; don't drop buffered text
+            yield buffer.flush()
+
+    except Exception as e:
+        logger.error("Error in streaming: %s", e)
+        yield buffer.flush() + error_frame(str(e))
+
+
+async def _study_events(rag, topic):
+    """Async generator yielding the SSE frames for a Bible study."""
+    try:
+        logger.debug("📚 Bible Study Topic: %s", topic)
+        logger.debug("📖 Retrieving relevant passages...")
+        passages = await asyncio.to_thread(rag.retrieve_passages, topic)
+        logger.debug("✅ Found %s relevant passages", len(passages))
+
+        if not passages:
+            yield NO_PASSAGES_FRAME
+            return
+
+        yield passages_frame(passages)
+
+        logger.debug("🤖 Generating Bible study (streaming)...")
+        async for frame in _llm_frames(rag, rag.build_study_prompt(topic, passages), STUDY_OPTIONS):
+            yield frame
+        logger.debug("✅ Bible study generated")
+
+    except Exception as e:
+        logger.error("Error in streaming study: %s", e)
+        yield error_frame(str(e))
+
+
+async def _prayer_events(rag, req_text):
+    """Async generator yielding the SSE frames for a prayer."""
+    try:
+        logger.debug("🙏 Prayer Request: %s", req_text)
+        logger.debug("📖 Retrieving relevant passages...")
+        passages = await asyncio.to_thread(rag.retrieve_passages, req_text)
+        logger.debug("✅ Found %s relevant passages", len(passages))
+
+        # Send passages (even if empty)
+        yield passages_frame(passages[:3])
+
+        logger.debug("🤖 Generating prayer (streaming)...")
+        async for frame in _llm_frames(rag, rag.build_prayer_prompt(req_text, passages), PRAYER_OPTIONS):
+            yield frame
+        logger.debug("✅ Prayer generated")
+
+    except Exception as e:
+        logger.error("Error in streaming prayer: %s", e)
+        yield error_frame(str(e))
+
+
+async def _llm_frames(rag, prompt, options):
+    """Stream a raw prompt through the async Ollama client as coalesced chunk frames."""
+    stream = await rag.async_client.generate(
+        model=rag.llm_model,
+        prompt=prompt,
+        stream=True,
+        options=options,
+        keep_alive=OLLAMA_LLM_KEEP_ALIVE
+    )
+    buffer = _ChunkBuffer()
+    try:
+        async for chunk in stream:
+            if chunk.get('response'):
+                frame = buffer.add(chunk['response'])
+                if frame:
+                    yield frame
+            if chunk.get('done'):
+                yield buffer.flush() + DONE_FRAME
+                break
+        else:
+            # Stream ended without a done marker; don't drop buffered text
+            yield buffer.flush()
+    except Exception:
+        # Hand over the buffered text before the caller sends its error frame
+        pending = buffer.flush()
+        if pending:
+            yield pending
+        raise
+    finally:
+        await stream.aclose()
+
+
+async def _stream_sse(frames, receive, send):
+    """
+    Send SSE frames until the generator finishes or the client goes away.
+    A disconnect cancels the producer, which closes the Ollama stream and
+    stops generation instead of burning GPU time for nobody.
+    """
+    await send({'type': 'http.response.start', 'status': 200, 'headers': SSE_HEADERS})
+
+    async def pump():
+        async for frame in frames:
+            await send({'type': 'http.response.body', 'body': frame, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    pump_task = asyncio.create_task(pump())
+    watch_task = asyncio.create_task(_wait_for_disconnect(receive))
+    done, _ = await asyncio.wait({pump_task, watch_task}, return_when=asyncio.FIRST_COMPLETED)
+
+    if pump_task in done:
+        watch_task.cancel()
+    else:
+        logger.debug("🔌 Client disconnected, stopping generation")
+        pump_task.cancel()
+
+    await asyncio.gather(pump_task, watch_task, return_exceptions=True)
+    await frames.aclose()
+
+
+async def _wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] != 'http.request':
+            break
+        chunks.append(message.get('body', b''))
+        more_body = message.get('more_body', False)
+    return b''.join(chunks)
+
+
+def _json_object(body: bytes):
+    """Parse a request body as a JSON object; None when it is not one."""
+    try:
+        data = orjson.loads(body) if body else {}
+    except orjson.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _text_field(data, key: str):
+    """Stripped string value of data[key], or None when missing, blank or not a string."""
+    if data is None:
+        return None
+    value = data.get(key, '')
+    if not isinstance(value, str):
+        return None
+    return value.strip() or None
+
+
+def _replay(body: bytes, receive):
+    """Wrap receive so an already-consumed request body can be read again."""
+    pending = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+    async def replay():
+        if pending:
+            return pending.pop()
+        return await receive()
+
+    return replay
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if wsgi.rag:
+                wsgi.rag.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run('asgi:app', host=SERVER_HOST, port=SERVER_PORT, workers=SERVER_WORKERS)
@@ -5,14 +5,21 @@ Shared between the embedding builder and the Flask application.
 
 from __future__ import annotations
 
+import os
 import re
+from functools import lru_cache
 from pathlib import Path
-from typing import Iterable, List, Sequence, Tuple
+from typing import Iterable, List, Tuple
 
 BIBLE_ROOT = Path("bible-data")
 
-_VERSE_HEADER_RE = re.compile(r"^\s*##\s*(\d+)\.\s*$")
+# Verse headers, scanned across a whole chapter at once. Horizontal whitespace
+# only, so a match never swallows neighbouring lines; BOM/backspace are tolerated
+# at the line edges like the per-line strip did.
+_VERSE_HEADER_RE = re.compile(r"^[ \t\r\f\v\ufeff\b]*##[ \t]*(\d+)\.[ \t\r\f\v\ufeff\b]*$", re.MULTILINE)
 _CHAPTER_NUMBER_RE = re.compile(r"(\d+)")
+# BOM and backspace bytes that turn up in some source files.
+_STRAY_CHARS = str.maketrans("", "", "\ufeff\b")
 
 
 def extract_book_name(folder_name: str) -> str:
@@ -28,8 +35,14 @@ def extract_chapter_number(file_path: Path | str) -> str:
     Returns "1" when no numeric suffix can be found.
     Looks for the LAST number in the filename to handle books like "1 Corinthians".
     """
-    stem = Path(file_path).stem
-    # Find all numbers in the stem and take the last one (the chapter number)
+    stem = os.path.splitext(os.path.basename(os.fspath(file_path)))[0]
+    # Filenames end in the chapter number (job12, 1corinthians13): walk back over it.
+    start = len(stem)
+    while start and stem[start - 1].isdecimal():
+        start -= 1
+    if start < len(stem):
+        return stem[start:]
+    # Otherwise take the last number anywhere in the stem
     matches = _CHAPTER_NUMBER_RE.findall(stem)
     return matches[-1] if matches else "1"
 
@@ -41,29 +54,24 @@ def to_relative_source_path(file_path: Path, bible_dir: Path | str = BIBLE_ROOT)
     return absolute.relative_to(base).as_posix()
 
 
-def parse_verses(markdown_text: str) -> List[Tuple[str, str]]:
+def parse_verses(markdown_text: str | bytes) -> List[Tuple[int, str]]:
     """
     Parse a markdown chapter into (verse_number, verse_text) tuples.
-    Verses are identified by lines that look like '## 12.'.
+    Verses are identified by lines that look like '## 12.'; verse numbers are
+    returned as ints.
+    Accepts raw UTF-8 bytes so callers can skip decoding the file themselves.
     """
-    verses: List[Tuple[str, str]] = []
-    verse_num: str | None = None
-    current_lines: List[str] = []
-
-    for raw_line in markdown_text.splitlines():
-        clean_line = raw_line.strip("\ufeff\b")
-        header_match = _VERSE_HEADER_RE.match(clean_line.strip())
-        if header_match:
-            if verse_num is not None:
-                verses.append((verse_num, _compact_lines(current_lines)))
-            verse_num = header_match.group(1)
-            current_lines = []
-        else:
-            # Preserve meaningful whitespace but collapse excess gaps later.
-            current_lines.append(clean_line.strip())
-
-    if verse_num is not None:
-        verses.append((verse_num, _compact_lines(current_lines)))
+    if isinstance(markdown_text, bytes):
+        markdown_text = markdown_text.decode("utf-8")
+
+    headers = list(_VERSE_HEADER_RE.finditer(markdown_text))
+    verses: List[Tuple[int, str]] = []
+
+    for index, header_match in enumerate(headers):
+        body_end = headers[index + 1].start() if index + 1 < len(headers) else len(markdown_text)
+        body = markdown_text[header_match.end():body_end].translate(_STRAY_CHARS)
+        # One C-level split collapses line breaks and runs of spaces alike.
+        verses.append((int(header_match.group(1)), " ".join(body.split())))
 
     return verses
 
@@ -73,44 +81,66 @@ def resolve_bible_path(relative_path: str, bible_dir: Path | str = BIBLE_ROOT) -
     Resolve a relative bible path such as 'Old Testament/18 Job/job1.md'
     and ensure it stays within the bible directory tree.
     """
-    base = Path(bible_dir).resolve()
-    candidate = (base / Path(relative_path)).resolve()
-    if not str(candidate).startswith(str(base)):
+    relative = Path(relative_path)
+    if ".." in relative.parts:
+        raise ValueError("Invalid bible path provided.")
+    base, base_prefix = _resolved_base(os.fspath(bible_dir))
+    candidate = (base / relative).resolve()
+    # Compare against base + separator so a sibling like 'bible-data-old' doesn't pass.
+    if not str(candidate).startswith(base_prefix):
         raise ValueError("Invalid bible path provided.")
     if not candidate.exists():
         raise FileNotFoundError(f"Bible markdown not found: {relative_path}")
     return candidate
 
 
-def _compact_lines(lines: Sequence[str]) -> str:
-    """Join verse lines with spaces while removing empty fragments."""
-    filtered = [line for line in lines if line]
-    return " ".join(filtered).strip()
+@lru_cache(maxsize=4)
+def _resolved_base(bible_dir: str) -> Tuple[Path, str]:
+    """Resolved bible directory and its separator-terminated prefix, computed once per directory."""
+    base = Path(bible_dir).resolve()
+    return base, os.path.join(str(base), "")
 
 
 def build_bible_index(bible_dir: Path | str = BIBLE_ROOT):
     """
     Return a structured index of available testaments, books, and chapters.
+    The result is memoized per directory (bible-data is static per deploy);
+    treat it as read-only and call build_bible_index.cache_clear() after
+    changing the files on disk.
     """
+    return _build_bible_index(os.fspath(bible_dir))
+
+
+@lru_cache(maxsize=4)
+def _build_bible_index(bible_dir: str):
     bible_path = Path(bible_dir)
     testaments = []
 
     for testament_name in ("Old Testament", "New Testament"):
         testament_path = bible_path / testament_name
-        if not testament_path.exists():
+        if not testament_path.is_dir():
             continue
 
+        # scandir returns the entry type with the directory read, so there is
+        # no extra stat() per book or chapter.
+        with os.scandir(testament_path) as entries:
+            book_folders = sorted((entry for entry in entries if entry.is_dir()), key=lambda entry: entry.name)
+
         books = []
-        for book_folder in sorted(t for t in testament_path.iterdir() if t.is_dir()):
+        for book_folder in book_folders:
             book_name = extract_book_name(book_folder.name)
-            chapters = []
+            with os.scandir(book_folder.path) as entries:
+                chapter_files = sorted(
+                    entry.name for entry in entries if entry.name.endswith(".md") and entry.is_file()
+                )
 
-            for file in sorted(book_folder.glob("*.md")):
-                chapter_num = extract_chapter_number(file)
+            chapters = []
+            for filename in chapter_files:
+                chapter_num = extract_chapter_number(filename)
                 chapters.append({
                     "number": chapter_num,
-                    "path": to_relative_source_path(file, bible_path),
-                    "filename": file.name,
+                    "path": f"{testament_name}/{book_folder.name}/{filename}",
+                    "filename": filename,
                 })
 
             # Sort chapters numerically by chapter number
@@ -129,3 +159,6 @@ def build_bible_index(bible_dir: Path | str = BIBLE_ROOT):
             })
 
     return testaments
+
+
+build_bible_index.cache_clear = _build_bible_index.cache_clear
@@ -3,16 +3,34 @@ Script to process the King James Bible markdown files and create a vector databa
 using Ollama's Gemma embeddings via ChromaDB.
 """
 
+import gzip
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import chromadb
 import ollama
+import orjson
+from vector_index import FLAT_INDEX_DIRNAME, FlatIndex, HnswIndex, storage_dtype
 from bible_utils import (
+    build_bible_index,
     extract_book_name,
     extract_chapter_number,
     parse_verses,
-    to_relative_source_path,
 )
 
+# Concurrent embedding requests; Ollama serves them in parallel (OLLAMA_NUM_PARALLEL).
+EMBED_WORKERS = int(os.getenv('WWAIJD_EMBED_WORKERS', '8'))
+# Must match the query-side model (WWAIJD_EMBED_MODEL in rag_pipeline).
+EMBED_MODEL = os.getenv('WWAIJD_EMBED_MODEL', 'embeddinggemma')
+# HNSW index parameters for the collection. The corpus is small, so a denser
+# graph (M) and wider construction/search beams buy near-exact recall cheaply.
+HNSW_SETTINGS = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 32,
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": 64,
+}
+
 
 def read_bible_files(bible_dir="bible-data"):
     """Read every Bible markdown chapter and capture its metadata."""
@@ -21,18 +39,25 @@ def read_bible_files(bible_dir="bible-data"):
 
     def process_testament(testament_name: str):
         testament_path = bible_path / testament_name
-        if not testament_path.exists():
+        if not testament_path.is_dir():
             return
 
-        for book_folder in sorted(testament_path.iterdir()):
-            if not book_folder.is_dir():
-                continue
+        # scandir carries the entry type from the directory read (no stat per entry)
+        with os.scandir(testament_path) as entries:
+            book_folders = sorted((entry for entry in entries if entry.is_dir()), key=lambda entry: entry.name)
 
+        for book_folder in book_folders:
             book_name = extract_book_name(book_folder.name)
-            for file in sorted(book_folder.glob("*.md")):
-                chapter_num = extract_chapter_number(file)
+            with os.scandir(book_folder.path) as entries:
+                chapter_files = sorted(
+                    (entry for entry in entries if entry.name.endswith(".md") and entry.is_file()),
+                    key=lambda entry: entry.name
+                )
+
+            for file in chapter_files:
+                chapter_num = extract_chapter_number(file.name)
                 print(f"Reading {book_name} {chapter_num} ({file.name})...")
-                with open(file, "r", encoding="utf-8") as f:
+                with open(file.path, "r", encoding="utf-8") as f:
                     content = f.read()
 
                 texts.append({
@@ -40,7 +65,7 @@ def read_bible_files(bible_dir="bible-data"):
                     "testament": testament_name,
                     "chapter": chapter_num,
                     "content": content,
-                    "source_path": to_relative_source_path(file, bible_path),
+                    "source_path": f"{testament_name}/{book_folder.name}/{file.name}",
                 })
 
     process_testament("Old Testament")
@@ -66,7 +91,9 @@ def chunk_bible_text(texts, chunk_size=500):
         if not verses:
             continue
 
-        current_chunk = ""
+        # Collect verse strings in a list and join on flush instead of growing a str
+        current_parts = []
+        current_length = 0
         verse_start = None
         verse_end = None
 
@@ -80,13 +107,14 @@ def chunk_bible_text(texts, chunk_size=500):
             verse_end = verse_num
             verse_content = f"{verse_num}. {verse_text} "
 
-            if len(current_chunk) + len(verse_content) < chunk_size:
-                current_chunk += verse_content
+            if current_length + len(verse_content) < chunk_size:
+                current_parts.append(verse_content)
+                current_length += len(verse_content)
             else:
-                if current_chunk and verse_start:
+                if current_parts and verse_start is not None:
                     verse_range = _format_verse_range(verse_start, verse_end)
                     chunks.append({
-                        "text": current_chunk.strip(),
+                        "text": "".join(current_parts).strip(),
                         "book": book,
                         "testament": testament,
                         "chapter": chapter_num,
@@ -95,14 +123,15 @@ def chunk_bible_text(texts, chunk_size=500):
                         "source_path": source_path,
                     })
 
-                current_chunk = verse_content
+                current_parts = [verse_content]
+                current_length = len(verse_content)
                 verse_start = verse_num
                 verse_end = verse_num
 
-        if current_chunk and verse_start:
+        if current_parts and verse_start is not None:
             verse_range = _format_verse_range(verse_start, verse_end)
             chunks.append({
-                "text": current_chunk.strip(),
+                "text": "".join(current_parts).strip(),
                 "book": book,
                 "testament": testament,
                 "chapter": chapter_num,
@@ -114,18 +143,18 @@ def chunk_bible_text(texts, chunk_size=500):
     return chunks
 
 
-def _format_verse_range(start: str, end: str | None) -> str:
+def _format_verse_range(start: int, end: int | None) -> str:
     """Format a readable verse range string."""
-    if not end or start == end:
+    if end is None or start == end:
         return str(start)
     return f"{start}-{end}"
 
 
 def create_embedding(text):
-    """Generate embeddings using Ollama's Gemma model."""
+    """Generate embeddings using the Ollama embedding model (EMBED_MODEL)."""
     try:
-        response = ollama.embeddings(model='embeddinggemma', prompt=text)
-        return response['embedding']
+        response = ollama.embed(model=EMBED_MODEL, input=text)
+        return response['embeddings'][0]
     except Exception as e:
         print(f"Error generating embedding: {e}")
         return None
@@ -134,6 +163,8 @@ def create_embedding(text):
 def build_vector_database(chunks, db_path="chroma_db"):
     """Build the ChromaDB vector database with Bible chunks."""
     print(f"\nBuilding vector database with {len(chunks)} chunks...")
+    # Reject a bad WWAIJD_FLAT_INDEX_DTYPE now rather than after every chunk is embedded
+    storage_dtype()
     
     # Remove old database if it exists to avoid dimension mismatch
     import shutil
@@ -145,14 +176,22 @@ def build_vector_database(chunks, db_path="chroma_db"):
     # Initialize ChromaDB client
     client = chromadb.PersistentClient(path=db_path)
     
-    # Create collection with explicit embedding dimension
+    # Create collection with explicit embedding dimension and HNSW tuning
     collection = client.create_collection(
         name="bible_kjv",
-        metadata={"description": "King James Bible verses for RAG", "embedding_dimension": 3072}
+        metadata={
+            "description": "King James Bible verses for RAG",
+            "embedding_dimension": 3072,
+            **HNSW_SETTINGS,
+        }
     )
     
-    # Add documents in batches
+    # Add documents in batches (and keep them for the flat index)
     batch_size = 100
+    all_documents = []
+    all_metadatas = []
+    all_embeddings = []
+    executor = ThreadPoolExecutor(max_workers=EMBED_WORKERS)
     for i in range(0, len(chunks), batch_size):
         batch = chunks[i:i + batch_size]
         print(f"Processing batch {i//batch_size + 1}/{(len(chunks) + batch_size - 1)//batch_size}...")
@@ -162,9 +201,10 @@ def build_vector_database(chunks, db_path="chroma_db"):
         ids = []
         embeddings = []
         
-        for j, chunk in enumerate(batch):
-            # Generate embedding
-            embedding = create_embedding(chunk['text'])
+        # Generate the batch's embeddings concurrently (map keeps chunk order)
+        batch_embeddings = executor.map(create_embedding, [chunk['text'] for chunk in batch])
+        
+        for j, (chunk, embedding) in enumerate(zip(batch, batch_embeddings)):
             if embedding is None:
                 continue
             
@@ -188,9 +228,44 @@ def build_vector_database(chunks, db_path="chroma_db"):
                 ids=ids,
                 embeddings=embeddings
             )
+            all_documents.extend(documents)
+            all_metadatas.extend(metadatas)
+            all_embeddings.extend(embeddings)
+    
+    executor.shutdown()
     
     print(f"\n✅ Vector database created successfully with {collection.count()} passages!")
     print(f"Database saved to: {db_path}")
+    
+    # Exact-search copy of the same vectors, searched instead of HNSW at query time
+    if all_embeddings:
+        flat_dir = os.path.join(db_path, FLAT_INDEX_DIRNAME)
+        FlatIndex.save(flat_dir, all_embeddings, all_documents, all_metadatas)
+        print(f"✅ Flat index saved to: {flat_dir}")
+        # The graph is optional (only WWAIJD_VECTOR_INDEX=hnsw reads it), so a missing
+        # extension must not throw away the database and flat index written above.
+        try:
+            HnswIndex.save(
+                flat_dir,
+                all_embeddings,
+                M=HNSW_SETTINGS["hnsw:M"],
+                construction_ef=HNSW_SETTINGS["hnsw:construction_ef"],
+            )
+            print(f"✅ HNSW graph saved to: {flat_dir}")
+        except ImportError as e:
+            print(f"⚠️  Skipping HNSW graph, hnswlib is not installed ({e}); install chroma-hnswlib to use WWAIJD_VECTOR_INDEX=hnsw")
+
+
+def export_bible_index(bible_dir="bible-data", static_dir="static"):
+    """
+    Write the /api/bible-index payload to static/bible-index.json plus a .gz twin,
+    so a reverse proxy can serve it directly (nginx: gzip_static on).
+    """
+    payload = orjson.dumps({'testaments': build_bible_index(bible_dir)})
+    static_path = Path(static_dir)
+    (static_path / "bible-index.json").write_bytes(payload)
+    (static_path / "bible-index.json.gz").write_bytes(gzip.compress(payload, compresslevel=9, mtime=0))
+    return len(payload)
 
 
 def main():
@@ -212,10 +287,10 @@ def main():
     try:
         models = ollama.list()
         model_names = [model['name'] for model in models.get('models', [])]
-        if not any('gemma' in name.lower() for name in model_names):
+        if not any(EMBED_MODEL.split(':')[0] in name.lower() for name in model_names):
             print("⚠️  Warning: Gemma model not found. Pulling it now...")
             print("   This may take a few minutes...")
-            ollama.pull('embeddinggemma')
+            ollama.pull(EMBED_MODEL)
             print("✅ Gemma model downloaded")
     except Exception as e:
         print(f"⚠️  Could not verify Gemma model: {e}")
@@ -235,6 +310,11 @@ def main():
     print("⚠️  This will take several minutes as we generate embeddings for each passage...")
     build_vector_database(chunks)
     
+    # Prebuilt bible index for the proxy
+    print("\nStep 4: Writing static Bible index...")
+    size = export_bible_index()
+    print(f"✅ Wrote static/bible-index.json ({size} bytes) and bible-index.json.gz")
+    
     print("\n" + "=" * 60)
     print("🎉 Setup complete! You can now run the application with:")
     print("   python app.py")
@@ -5,6 +5,10 @@ Requires: pip install Pillow
 
 from PIL import Image
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Every output is at most 180px, so resize from one 256px copy instead of the full image.
+BASE_SIZE = (256, 256)
 
 def generate_favicons():
     """Generate various favicon sizes from the meta image."""
@@ -31,12 +35,26 @@ def generate_favicons():
         (180, 180, 'apple-touch-icon.png'),
     ]
     
+    ico_sizes = [(16, 16), (32, 32), (48, 48)]
+    
+    # One LANCZOS pass down from the source, then every size from that smaller copy
+    if img.width > BASE_SIZE[0] or img.height > BASE_SIZE[1]:
+        img = img.resize(BASE_SIZE, Image.Resampling.LANCZOS)
+    
+    # Resize each distinct size once (16/32 serve both the PNGs and the ICO);
+    # Pillow releases the GIL while resampling, so the sizes run in parallel.
+    all_sizes = list(dict.fromkeys([(width, height) for width, height, _ in sizes] + ico_sizes))
+    with ThreadPoolExecutor(max_workers=min(len(all_sizes), os.cpu_count() or 1)) as executor:
+        resized_by_size = dict(zip(
+            all_sizes,
+            executor.map(lambda size: img.resize(size, Image.Resampling.LANCZOS), all_sizes)
+        ))
+    
     print("\n🎨 Generating favicon files...")
     
     for width, height, filename in sizes:
         output_path = os.path.join(output_dir, filename)
-        resized = img.resize((width, height), Image.Resampling.LANCZOS)
-        resized.save(output_path, 'PNG', optimize=True)
+        resized_by_size[(width, height)].save(output_path, 'PNG', optimize=True)
         print(f"  ✅ Created {filename} ({width}x{height})")
     
     # Generate .ico file (contains multiple sizes)
@@ -44,19 +62,15 @@ def generate_favicons():
     ico_path = os.path.join(output_dir, 'favicon.ico')
     
     # Create ICO with multiple sizes
-    ico_sizes = [(16, 16), (32, 32), (48, 48)]
-    ico_images = []
-    
-    for width, height in ico_sizes:
-        resized = img.resize((width, height), Image.Resampling.LANCZOS)
-        ico_images.append(resized)
+    ico_images = [resized_by_size[size] for size in ico_sizes]
     
-    # Save as ICO
-    ico_images[0].save(
+    # Save as ICO from the largest frame; Pillow drops requested sizes bigger
+    # than the image it saves from, so saving from 16x16 kept only that frame.
+    ico_images[-1].save(
         ico_path,
         format='ICO',
         sizes=[(img.width, img.height) for img in ico_images],
-        append_images=ico_images[1:]
+        append_images=ico_images[:-1]
     )
     print(f"  ✅ Created favicon.ico (multi-size)")
     
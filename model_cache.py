@@ -0,0 +1,37 @@
+"""
+Embedding model cache for What Would AI Jesus Do
+Records each embedding model's output dimension and Ollama digest in a small
+JSON file. startup_check.py writes it; the RAG pipeline reads it to refuse a
+database built with a different model.
+"""
+
+import json
+import os
+from pathlib import Path
+
+# Embedding dimension and digest per model, so starts can skip the probe embed call.
+MODEL_CACHE_FILE = Path(os.getenv('WWAIJD_CACHE_FILE', Path.home() / '.wwaijd' / 'cache.json'))
+
+
+def load_dim_cache():
+    """Cached {model: {'dim', 'digest'}} entries; empty when missing or unreadable."""
+    try:
+        with open(MODEL_CACHE_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def save_dim_cache(model, dim, digest):
+    """Store one model's dimension and digest, keeping the other entries."""
+    data = load_dim_cache()
+    data[model] = {'dim': dim, 'digest': digest}
+    try:
+        MODEL_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = MODEL_CACHE_FILE.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, MODEL_CACHE_FILE)
+    except OSError as e:
+        print(f"⚠️  Could not write {MODEL_CACHE_FILE}: {e}")
@@ -3,10 +3,29 @@ RAG Pipeline for What Would AI Jesus Do
 Retrieves relevant Bible passages and generates responses using Gemma3:4b
 """
 
+import asyncio
+import logging
 import os
-import chromadb
-import ollama
-from typing import List, Dict, Optional
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from dataclasses import dataclass, replace
+from functools import lru_cache
+import numpy as np
+import orjson
+from typing import TYPE_CHECKING, List, Dict, Optional, Sequence
+
+from semantic_cache import SemanticCache
+from model_cache import load_dim_cache
+from vector_index import FLAT_INDEX_DIRNAME, open_flat_index, open_hnsw_index
+
+if TYPE_CHECKING:
+    import ollama
+
+logger = logging.getLogger(__name__)
 
 # Focus modes allow the caller to steer tone and structure without changing the UX copy.
 MODE_INSTRUCTIONS = {
@@ -17,10 +36,216 @@ MODE_INSTRUCTIONS = {
     'blessing': 'Respond briefly with encouragement plus a short closing prayer rooted in the cited verses.'
 }
 DEFAULT_MODE = 'balanced'
-DEFAULT_EMBED_MODEL = 'embeddinggemma'
-DEFAULT_LLM_MODEL = 'gemma3:4b'
-DEFAULT_EMBED_KEEP_ALIVE = os.getenv('WWAIJD_EMBED_KEEP_ALIVE', '0s')
+
+# Answer instructions, sent as the system prompt. They are identical for every
+# request, so the rendered prompt starts with the same tokens each time and
+# Ollama can reuse the KV cache for that prefix instead of re-processing it.
+ANSWER_SYSTEM_PROMPT = """You are AI Jesus, a wise and compassionate guide who provides advice based on Biblical teachings from the King James Bible. A person will ask you a question, and you will be given relevant Bible passages to help answer.
+
+Based on those Biblical passages, provide a thoughtful response in the voice of Jesus. Please:
+- Reference the specific Bible passages that inform your answer (e.g., cite book and verse inline).
+- Stay grounded in the provided passages; avoid inventing references.
+- Offer practical guidance that can be acted on today.
+- Keep the answer under about 180 words unless brevity would harm clarity.
+- If passages seem weakly related, briefly acknowledge that and invite the reader to explore the cited verses."""
+# Per-request part of the answer prompt; {tone} is filled per mode below, {query}/{context} per request.
+ANSWER_PROMPT_TEMPLATE = """Question: {query}
+
+{context}
+
+Guidance: {tone}
+
+Response:"""
+# One prompt answering in several modes at once; {guidance} lists '- "mode": instruction' lines.
+BUNDLE_PROMPT_TEMPLATE = """Question: {query}
+
+{context}
+
+Answer the question once for each guidance below. Return a JSON object whose keys are exactly the quoted names and whose values are the answers as plain text:
+{guidance}"""
+STUDY_PROMPT_TEMPLATE = """You are AI Jesus, a wise teacher. Create a short Bible study on the topic: "{topic}".
+        
+{context}
+
+Structure the study as follows:
+1. **Introduction**: Briefly introduce the topic.
+2. **Key Verses**: Discuss 2-3 of the provided verses and their meaning.
+3. **Reflection**: Ask 2-3 questions to help the reader apply this to their life.
+4. **Prayer**: A short closing prayer.
+
+Keep the tone encouraging and insightful.
+"""
+PRAYER_PROMPT_TEMPLATE = """You are AI Jesus. A user has asked for prayer: "{request}".
+        
+{context}
+
+Write a heartfelt, comforting prayer for them. 
+- Address their specific situation.
+- Weave in the themes from the verses if applicable.
+- Keep it under 150 words.
+- End with "Amen."
+"""
+MODE_KEYS = frozenset(MODE_INSTRUCTIONS)
+# Per-mode templates with the tone already substituted (braces escaped for format_map).
+_ANSWER_PROMPTS = {
+    mode: ANSWER_PROMPT_TEMPLATE.replace('{tone}', instruction.replace('{', '{{').replace('}', '}}'))
+    for mode, instruction in MODE_INSTRUCTIONS.items()
+}
+# Bundle guidance line per mode, joined per request in the requested order.
+_BUNDLE_GUIDANCE = {mode: f'- "{mode}": {instruction}' for mode, instruction in MODE_INSTRUCTIONS.items()}
+# Lead-in lines for the numbered passage lists.
+ANSWER_CONTEXT_HEADER = "Here are relevant passages from the King James Bible:\n\n"
+STUDY_CONTEXT_HEADER = "Here are relevant passages:\n\n"
+PRAYER_CONTEXT_HEADER = "Here are some relevant verses to inspire the prayer:\n\n"
+# Sampling options per request type. num_predict hard-caps the output so a model that
+# ignores the prompt's length hint can't stretch worst-case latency (~1.5 tokens per
+# word: 180-word answers, 150-word prayers, a four-part study). Comfort and blessing
+# answers need less variety, so they sample from a tighter nucleus.
+ANSWER_NUM_PREDICT = 280
+ANSWER_TOP_P = {'comfort': 0.8, 'blessing': 0.8}
+_ANSWER_OPTIONS = {
+    mode: {'temperature': 0.7, 'top_p': ANSWER_TOP_P.get(mode, 0.9), 'num_predict': ANSWER_NUM_PREDICT}
+    for mode in MODE_INSTRUCTIONS
+}
+STUDY_OPTIONS = {'temperature': 0.7, 'num_predict': 320}
+PRAYER_OPTIONS = {'temperature': 0.8, 'num_predict': 200}
+# Ollama model tags; override to run e.g. a different quantization of the LLM.
+DEFAULT_EMBED_MODEL = os.getenv('WWAIJD_EMBED_MODEL', 'embeddinggemma')
+DEFAULT_LLM_MODEL = os.getenv('WWAIJD_LLM_MODEL', 'gemma3:4b')
+# How long Ollama keeps each model loaded after a request. The embedder is small, and
+# reloading it for every question cost more than the embedding itself; -1 pins it.
+DEFAULT_EMBED_KEEP_ALIVE = os.getenv('WWAIJD_EMBED_KEEP_ALIVE', '5m')
 DEFAULT_LLM_KEEP_ALIVE = os.getenv('WWAIJD_LLM_KEEP_ALIVE', '120s')
+# Load the models into Ollama when the pipeline starts so the first question doesn't wait on it.
+PREWARM_MODELS = os.getenv('WWAIJD_PREWARM_MODELS', '1') != '0'
+# Each uncached question also asks Ollama to (re)load the LLM in the background while
+# its passages are searched, at most once per this many seconds (well inside keep_alive).
+LLM_TOUCH_INTERVAL = 30
+# Answers kept for near-duplicate questions (cosine >= 0.95); 0 disables the cache.
+ANSWER_CACHE_SIZE = int(os.getenv('WWAIJD_ANSWER_CACHE_SIZE', '1024'))
+# Query embeddings kept in memory per process; 0 disables the cache.
+EMBED_CACHE_SIZE = int(os.getenv('WWAIJD_EMBED_CACHE_SIZE', '1024'))
+# Retrieval results kept per (query, top_k) so study/prayer/ask on one topic search once; 0 disables.
+RETRIEVAL_CACHE_SIZE = int(os.getenv('WWAIJD_RETRIEVAL_CACHE_SIZE', '256'))
+# Seconds a cached retrieval result stays valid; 0 keeps it until evicted or invalidated.
+RETRIEVAL_CACHE_TTL = float(os.getenv('WWAIJD_RETRIEVAL_CACHE_TTL', '0'))
+# Seconds a request waits on the retrieval batcher before giving up with a TimeoutError.
+RETRIEVAL_TIMEOUT = float(os.getenv('WWAIJD_RETRIEVAL_TIMEOUT', '30'))
+# 'flat' searches the exact index written by build_embeddings.py when it exists, 'hnsw' its
+# standalone hnswlib graph; 'chroma' (or a missing file) queries the collection.
+VECTOR_INDEX = os.getenv('WWAIJD_VECTOR_INDEX', 'flat').lower()
+HNSW_SEARCH_EF = int(os.getenv('WWAIJD_HNSW_EF', '64'))
+# One keep-alive connection pool per process for every Ollama call. Generation
+# can take minutes, so only the connect phase gets a short timeout.
+OLLAMA_TIMEOUT_SECONDS = 300
+OLLAMA_CONNECT_TIMEOUT_SECONDS = 10
+OLLAMA_POOL_LIMITS = {'max_keepalive_connections': 40, 'max_connections': 100, 'keepalive_expiry': 30}
+# Chunks a streaming response may read ahead of a slow consumer.
+STREAM_PREFETCH = 64
+# Passages injected into a prompt. Prefill cost grows with every token, so weak matches
+# (relevance is min-max scaled per query, 0-100) are left out and long passages are cut.
+# The API still returns every retrieved passage.
+CONTEXT_MAX_PASSAGES = int(os.getenv('WWAIJD_CONTEXT_PASSAGES', '5'))
+CONTEXT_MAX_PASSAGE_CHARS = int(os.getenv('WWAIJD_CONTEXT_PASSAGE_CHARS', '400'))
+CONTEXT_MIN_RELEVANCE = float(os.getenv('WWAIJD_CONTEXT_MIN_RELEVANCE', '20'))
+# Result fields retrieval reads; neighbour embeddings are never needed.
+QUERY_INCLUDE = ['documents', 'metadatas', 'distances']
+
+_ollama_lock = threading.Lock()
+_ollama_client: Optional["ollama.Client"] = None
+_ollama_client_pid: Optional[int] = None
+
+_database_lock = threading.Lock()
+_databases: Dict[str, tuple] = {}
+_databases_pid: Optional[int] = None
+
+
+def _get_chromadb():
+    """
+    Import chromadb on first use. It takes the better part of a second to
+    import, so processes that never open a pipeline don't pay for it.
+    """
+    import chromadb
+    return chromadb
+
+
+def _get_ollama():
+    """Import the ollama client (and httpx under it) on first use."""
+    import ollama
+    return ollama
+
+
+def _ollama_http_options() -> Dict:
+    """httpx timeout and pool settings shared by the sync and async Ollama clients."""
+    import httpx
+    return {
+        'timeout': httpx.Timeout(OLLAMA_TIMEOUT_SECONDS, connect=OLLAMA_CONNECT_TIMEOUT_SECONDS),
+        'limits': httpx.Limits(**OLLAMA_POOL_LIMITS),
+    }
+
+
+def ollama_client() -> "ollama.Client":
+    """
+    Process-wide Ollama client sharing one httpx connection pool.
+    Created lazily and again after a fork, so server workers never share sockets.
+    """
+    global _ollama_client, _ollama_client_pid
+    pid = os.getpid()
+    if _ollama_client is None or _ollama_client_pid != pid:
+        with _ollama_lock:
+            if _ollama_client is None or _ollama_client_pid != pid:
+                _ollama_client = _get_ollama().Client(**_ollama_http_options())
+                _ollama_client_pid = pid
+    return _ollama_client
+
+
+def _open_vector_index(db_path: str):
+    """The in-process index WWAIJD_VECTOR_INDEX selects, or None to query Chroma itself."""
+    if VECTOR_INDEX == 'flat':
+        return open_flat_index(db_path)
+    if VECTOR_INDEX == 'hnsw':
+        return open_hnsw_index(db_path, HNSW_SEARCH_EF)
+    return None
+
+
+def _open_database(db_path: str) -> tuple:
+    """
+    (client, collection, flat index) for db_path, opened once per process.
+    Every BibleRAG on the same database shares the sqlite handle and the loaded
+    indexes instead of opening its own; after a fork they are opened afresh.
+    """
+    global _databases_pid
+    key = os.path.abspath(db_path)
+    pid = os.getpid()
+    with _database_lock:
+        if _databases_pid != pid:
+            _databases.clear()
+            _databases_pid = pid
+        database = _databases.get(key)
+        if database is None:
+            client = _get_chromadb().PersistentClient(path=db_path)
+            collection = client.get_collection(name="bible_kjv")
+            vector_index = _open_vector_index(db_path)
+            database = _databases[key] = (client, collection, vector_index)
+    return database
+
+
+@dataclass(frozen=True, slots=True)
+class Passage:
+    """
+    One retrieved passage. Slots keep it small, and frozen instances can be
+    shared from the retrieval cache without copying. orjson serializes it as
+    an object with these fields, in this order.
+    """
+    text: str
+    reference: str
+    book: str
+    testament: str
+    chapter: Optional[int]
+    verses: Optional[str]
+    source_path: Optional[str]
+    distance: float
+    relevance: Optional[float]
 
 
 class BibleRAG:
@@ -34,6 +259,9 @@ class BibleRAG:
         llm_model: str = DEFAULT_LLM_MODEL,
         embed_keep_alive: Optional[str | float] = None,
         llm_keep_alive: Optional[str | float] = None,
+        max_passages: int = CONTEXT_MAX_PASSAGES,
+        max_passage_chars: int = CONTEXT_MAX_PASSAGE_CHARS,
+        min_relevance: float = CONTEXT_MIN_RELEVANCE,
     ):
         """
         Initialize the RAG pipeline.
@@ -43,8 +271,11 @@ class BibleRAG:
             top_k: Number of relevant passages to retrieve
             embedding_model: Ollama embedding model name
             llm_model: Ollama generation model name
-            embed_keep_alive: How long to keep the embedding model in VRAM (string or seconds). Defaults to '0s' so it unloads immediately.
+            embed_keep_alive: How long to keep the embedding model in VRAM (string or seconds). Defaults to '5m' (WWAIJD_EMBED_KEEP_ALIVE); '0s' unloads it after every call.
             llm_keep_alive: How long to keep the LLM in VRAM (string or seconds). Defaults to 2 minutes.
+            max_passages: Most passages put into a prompt
+            max_passage_chars: Passage text longer than this is cut (with an ellipsis) in prompts; 0 keeps it whole
+            min_relevance: Passages scoring below this are left out of prompts (the best one is always kept)
         """
         self.db_path = db_path
         self.top_k = top_k
@@ -52,62 +283,332 @@ class BibleRAG:
         self.llm_model = llm_model or DEFAULT_LLM_MODEL
         self.embed_keep_alive = DEFAULT_EMBED_KEEP_ALIVE if embed_keep_alive is None else embed_keep_alive
         self.llm_keep_alive = DEFAULT_LLM_KEEP_ALIVE if llm_keep_alive is None else llm_keep_alive
-        self.client = chromadb.PersistentClient(path=db_path)
-        self.collection = self.client.get_collection(name="bible_kjv")
+        self._embed_keep_alive_seconds = _keep_alive_seconds(self.embed_keep_alive)
+        self.max_passages = max_passages
+        self.max_passage_chars = max_passage_chars
+        self.min_relevance = min_relevance
+        self.client, self.collection, self.vector_index = _open_database(db_path)
+        self._check_embedding_dimension()
+        self.retrieval_batcher = RetrievalBatcher(self)
+        self.answer_cache = SemanticCache(capacity=ANSWER_CACHE_SIZE)
+        self._retrieve_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._retrieve_lock = threading.Lock()
+        # Last (key, text) built by _build_prompt / _format_context; swapped whole, so no lock
+        self._last_prompt: Optional[tuple] = None
+        self._last_context: Optional[tuple] = None
+        self._llm_touched_at = float('-inf')
+        self._llm_touch_lock = threading.Lock()
+        self._async_client = None
+        # Load the vector index in the background; the first question's embedding
+        # call overlaps with it instead of paying for it on top.
+        threading.Thread(target=self._prewarm_index, name="index-prewarm", daemon=True).start()
+        if PREWARM_MODELS:
+            threading.Thread(target=self.warmup, name="model-prewarm", daemon=True).start()
         
-    def generate_query_embedding(self, query: str):
-        """Generate embedding for the user's query."""
+    def _check_embedding_dimension(self):
+        """
+        Fail fast when startup_check has recorded a dimension for the embedding
+        model that differs from the database's vectors (the model was changed
+        without rebuilding). Uses only local files, no Ollama call.
+        """
+        cached = load_dim_cache().get(self.embedding_model)
+        if not cached or not cached.get('dim'):
+            return
+        if self.vector_index is not None:
+            stored_dim = self.vector_index.dim
+        else:
+            sample = self.collection.get(limit=1, include=['embeddings'])
+            if not sample.get('embeddings'):
+                return
+            stored_dim = len(sample['embeddings'][0])
+        if stored_dim != cached['dim']:
+            raise ValueError(
+                f"{self.embedding_model} produces {cached['dim']}-dimensional embeddings but the database at "
+                f"{self.db_path} holds {stored_dim}-dimensional ones; rebuild it with build_embeddings.py"
+            )
+
+    @property
+    def async_client(self) -> "ollama.AsyncClient":
+        """Ollama client for the ASGI streaming routes, created on first use."""
+        if self._async_client is None:
+            self._async_client = _get_ollama().AsyncClient(**_ollama_http_options())
+        return self._async_client
+
+    def _prewarm_index(self):
+        """
+        Read the index files ahead and run one query so the first question finds
+        the index in memory. The in-process indexes are queried directly; only the
+        'chroma' backend makes Chroma load its HNSW segment, which the others never use.
+        """
+        if self.vector_index is not None:
+            _advise_willneed(os.path.join(self.db_path, FLAT_INDEX_DIRNAME))
+            try:
+                probe = [1.0] + [0.0] * (self.vector_index.dim - 1)
+                self.vector_index.query(query_embeddings=[probe], n_results=1)
+            except Exception as e:
+                logger.warning("Index prewarm skipped: %s", e)
+            return
+        _advise_willneed(self.db_path)
         try:
-            response = ollama.embeddings(
-                model=self.embedding_model,
-                prompt=query,
-                keep_alive=self.embed_keep_alive
+            sample = self.collection.get(limit=1, include=['embeddings'])
+            if sample.get('embeddings'):
+                self.collection.query(query_embeddings=[list(sample['embeddings'][0])], n_results=1, include=['distances'])
+        except Exception as e:
+            logger.warning("Index prewarm skipped: %s", e)
+
+    def warmup(self):
+        """
+        Load the LLM (and the embedder, unless it is set to unload right away)
+        with their configured keep_alive, so the first question finds both
+        resident. The LLM call also processes the shared system prompt, so its
+        KV prefix is cached too. Runs in the background at startup unless
+        WWAIJD_PREWARM_MODELS=0.
+        """
+        client = ollama_client()
+        try:
+            client.generate(
+                model=self.llm_model,
+                prompt='Hello',
+                system=ANSWER_SYSTEM_PROMPT,
+                options={'num_predict': 1},
+                keep_alive=self.llm_keep_alive
             )
-            return response['embedding']
+            if self._embed_keep_alive_seconds != 0:
+                _embed_inputs(self.embedding_model, ['warmup'], self.embed_keep_alive)
+            self._llm_touched_at = time.monotonic()
+            logger.info("✅ Models prewarmed")
         except Exception as e:
-            print(f"Error generating query embedding: {e}")
+            logger.warning("Model prewarm skipped: %s", e)
+
+    def touch_llm(self):
+        """
+        Start loading the LLM in the background if it hasn't been touched within
+        LLM_TOUCH_INTERVAL. An empty-prompt generate only loads the model, so an
+        LLM Ollama unloaded while the app was idle comes back during retrieval
+        instead of after it. Disabled by WWAIJD_PREWARM_MODELS=0.
+        """
+        if not PREWARM_MODELS:
+            return
+        now = time.monotonic()
+        with self._llm_touch_lock:
+            if now - self._llm_touched_at < LLM_TOUCH_INTERVAL:
+                return
+            self._llm_touched_at = now
+        threading.Thread(target=self._load_llm, name="llm-touch", daemon=True).start()
+
+    def _load_llm(self):
+        try:
+            ollama_client().generate(model=self.llm_model, prompt='', keep_alive=self.llm_keep_alive)
+        except Exception as e:
+            logger.warning("LLM load skipped: %s", e)
+
+    def generate_query_embedding(self, query: str):
+        """
+        Generate embedding for the user's query.
+        Queries are normalized (lowercased, whitespace collapsed) and the
+        embedding is memoized, so a repeated question skips the Ollama call.
+        """
+        try:
+            return list(_embed_query(self.embedding_model, _normalize_query(query), self.embed_keep_alive))
+        except Exception as e:
+            logger.error("Error generating query embedding: %s", e)
             return None
+
+    def generate_query_embeddings(self, queries: List[str]) -> List[Optional[List[float]]]:
+        """
+        Embed several queries with one /api/embed request.
+        Returns one embedding per query in the same order (all None on failure).
+        """
+        if not queries:
+            return []
+        normalized = [_normalize_query(query) for query in queries]
+        unique = list(dict.fromkeys(normalized))
+        try:
+            embeddings = _embed_inputs(self.embedding_model, unique, self.embed_keep_alive)
+        except Exception as e:
+            logger.error("Error generating query embeddings: %s", e)
+            return [None] * len(queries)
+        by_query = dict(zip(unique, embeddings))
+        return [by_query.get(query) for query in normalized]
+    
+    @classmethod
+    def close(cls):
+        """
+        Shut down every database this process opened (sqlite handles, HNSW
+        segments, flat indexes). Call at shutdown; pipelines created before the
+        call must not be used afterwards, and new ones reopen their database.
+        """
+        with _database_lock:
+            databases = list(_databases.values())
+            _databases.clear()
+        if not databases:
+            return
+        for client, _, _ in databases:
+            # chromadb 0.4 has no public close(); stopping the system releases its files
+            client._system.stop()
+        # Drop Chroma's own per-path client registry so a reopen starts fresh
+        _get_chromadb().api.client.SharedSystemClient.clear_system_cache()
+    
+    @classmethod
+    def clear_embedding_cache(cls):
+        """Forget memoized query embeddings, e.g. after swapping the embedding model in Ollama."""
+        _embed_query.cache_clear()
+    
+    @classmethod
+    def embedding_cache_info(cls):
+        """Hit/miss counters of the query embedding cache (functools cache_info)."""
+        return _embed_query.cache_info()
     
-    def retrieve_passages(self, query: str) -> List[Dict]:
+    def retrieve_passages(self, query: str, query_embedding: Optional[List[float]] = None) -> List[Passage]:
         """
         Retrieve relevant Bible passages based on the query.
         
         Args:
             query: User's question
+            query_embedding: Precomputed embedding for the query, if the caller has one
             
         Returns:
             List of relevant passages with metadata
         """
+        cached = self._cached_passages(query)
+        if cached is not None:
+            return cached
+        
         # Generate query embedding
-        query_embedding = self.generate_query_embedding(query)
+        if query_embedding is None:
+            query_embedding = self.generate_query_embedding(query)
         if query_embedding is None:
             return []
         
         # Query the vector database
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=self.top_k
-        )
-        distances = results['distances'][0] if results and 'distances' in results else []
-        normalized_scores = self._normalize_relevance(distances)
+        results = self._search([query_embedding])
+        passages = self._format_results(results, 0)
+        self._store_passages(query, passages)
+        return passages
+    
+    def retrieve_passages_batch(self, queries: List[str], embeddings: Optional[List] = None) -> List[List[Passage]]:
+        """
+        Retrieve passages for several queries with a single vector database call.
         
-        # Format results
-        passages = []
-        if results and results['documents']:
-            for i in range(len(results['documents'][0])):
-                passages.append({
-                    'text': results['documents'][0][i],
-                    'reference': results['metadatas'][0][i]['reference'],
-                    'book': results['metadatas'][0][i]['book'],
-                    'testament': results['metadatas'][0][i]['testament'],
-                    'chapter': results['metadatas'][0][i].get('chapter'),
-                    'verses': results['metadatas'][0][i].get('verses'),
-                    'source_path': results['metadatas'][0][i].get('source_path'),
-                    'distance': results['distances'][0][i] if 'distances' in results else 0,
-                    'relevance': normalized_scores[i] if normalized_scores else None
-                })
+        Args:
+            queries: User questions
+            embeddings: Optional precomputed embeddings aligned with queries (None entries are generated in one batch)
+            
+        Returns:
+            One list of passages per query, in the same order
+        """
+        embeddings = list(embeddings) if embeddings is not None else [None] * len(queries)
+        passages_per_query = [self._cached_passages(query) for query in queries]
+        pending = [i for i, passages in enumerate(passages_per_query) if passages is None]
+        missing = [i for i in pending if embeddings[i] is None]
+        if missing:
+            # One batched embed call for every query that arrived without an embedding
+            generated = self.generate_query_embeddings([queries[i] for i in missing])
+            for i, embedding in zip(missing, generated):
+                embeddings[i] = embedding
+        rows = [i for i in pending if embeddings[i] is not None]
+        for i in pending:
+            passages_per_query[i] = []
+        if not rows:
+            return passages_per_query
         
-        return passages
+        results = self._search([embeddings[i] for i in rows])
+        for row, query_index in enumerate(rows):
+            passages = self._format_results(results, row)
+            self._store_passages(queries[query_index], passages)
+            passages_per_query[query_index] = passages
+        return passages_per_query
+    
+    def retrieve_passages_multi(self, queries: List[str]) -> List[Passage]:
+        """
+        Retrieve for several phrasings of one question (synonym expansion, a
+        hypothetical answer, ...) with one embed request and one vector search.
+        The union is deduplicated by reference, keeping each passage's closest
+        distance, and the best top_k are returned with relevance rescored
+        across the merged list.
+        """
+        embeddings = [embedding for embedding in self.generate_query_embeddings(queries) if embedding is not None]
+        if not embeddings:
+            return []
+        results = self._search(embeddings)
+        
+        best = {}
+        for documents, metadatas, distances in zip(results['documents'], results['metadatas'], results['distances']):
+            for text, metadata, distance in zip(documents, metadatas, distances):
+                reference = metadata['reference']
+                if reference not in best or distance < best[reference][2]:
+                    best[reference] = (text, metadata, distance)
+        merged = sorted(best.values(), key=lambda hit: hit[2])[:self.top_k]
+        return self._format_results({
+            'documents': [[hit[0] for hit in merged]],
+            'metadatas': [[hit[1] for hit in merged]],
+            'distances': [[hit[2] for hit in merged]],
+        }, 0)
+    
+    def _search(self, embeddings: List[List[float]]) -> Dict:
+        """Nearest passages for each embedding, from the flat index when loaded, else Chroma."""
+        index = self.vector_index if self.vector_index is not None else self.collection
+        return index.query(query_embeddings=embeddings, n_results=self.top_k, include=QUERY_INCLUDE)
+    
+    def _cached_passages(self, query: str) -> Optional[List[Passage]]:
+        """The cached passages for a query (as a fresh list), or None on a miss."""
+        if RETRIEVAL_CACHE_SIZE <= 0:
+            return None
+        key = (_normalize_query(query), self.top_k)
+        with self._retrieve_lock:
+            entry = self._retrieve_cache.get(key)
+            if entry is None:
+                return None
+            stored_at, cached = entry
+            if RETRIEVAL_CACHE_TTL > 0 and time.monotonic() - stored_at > RETRIEVAL_CACHE_TTL:
+                del self._retrieve_cache[key]
+                return None
+            self._retrieve_cache.move_to_end(key)
+        # Passages are immutable, so only the list needs to be new
+        return list(cached)
+    
+    def _store_passages(self, query: str, passages: List[Passage]):
+        """Remember a retrieval result, evicting the least recently used beyond the cap."""
+        if RETRIEVAL_CACHE_SIZE <= 0 or not passages:
+            return
+        key = (_normalize_query(query), self.top_k)
+        with self._retrieve_lock:
+            self._retrieve_cache[key] = (time.monotonic(), tuple(passages))
+            self._retrieve_cache.move_to_end(key)
+            while len(self._retrieve_cache) > RETRIEVAL_CACHE_SIZE:
+                self._retrieve_cache.popitem(last=False)
+    
+    def invalidate_retrieval_cache(self):
+        """Forget cached retrieval results, e.g. after the database is rebuilt."""
+        with self._retrieve_lock:
+            self._retrieve_cache.clear()
+    
+    def _format_results(self, results: Dict, row: int) -> List[Passage]:
+        """Turn one row of a ChromaDB query result into Passages."""
+        if not results or not results['documents']:
+            return []
+        
+        # Pull the row's columns out once instead of re-indexing per field
+        documents = results['documents'][row]
+        metadatas = results['metadatas'][row]
+        has_distances = 'distances' in results
+        distances = results['distances'][row] if has_distances else [0] * len(documents)
+        normalized_scores = (self._normalize_relevance(distances) if has_distances else None) or [None] * len(documents)
+        
+        return [
+            Passage(
+                text,
+                metadata['reference'],
+                metadata['book'],
+                metadata['testament'],
+                metadata.get('chapter'),
+                metadata.get('verses'),
+                metadata.get('source_path'),
+                distance,
+                relevance,
+            )
+            for text, metadata, distance, relevance in zip(documents, metadatas, distances, normalized_scores)
+        ]
     
     def _normalize_relevance(self, distances: List[float]) -> List[float]:
         """
@@ -117,51 +618,49 @@ class BibleRAG:
         if not distances:
             return []
         try:
+            # Builtin min/max beat array reductions at top_k sizes; the scaling
+            # below is then one subtract, one multiply and one round. (max - d)
+            # lands in [0, span] without clipping, and float64 keeps the rounded
+            # scores identical to the scalar 1 - (d - min) / span formula.
             min_distance = min(distances)
             max_distance = max(distances)
             if max_distance == min_distance:
-                return [100.0 for _ in distances]
-            scores = []
-            for value in distances:
-                normalized = 1 - ((value - min_distance) / (max_distance - min_distance))
-                scores.append(round(max(0.0, min(1.0, normalized)) * 100, 1))
-            return scores
+                return [100.0] * len(distances)
+            values = np.asarray(distances, dtype=np.float64)
+            scale = 100 / (max_distance - min_distance)
+            return ((max_distance - values) * scale).round(1).tolist()
         except Exception:
             return []
     
     def _normalize_mode(self, mode: Optional[str]) -> str:
         """Map provided mode to a supported key."""
-        if not mode:
-            return DEFAULT_MODE
-        mode_key = mode.strip().lower()
-        return mode_key if mode_key in MODE_INSTRUCTIONS else DEFAULT_MODE
+        return resolve_mode(mode)
     
-    def _build_prompt(self, query: str, passages: List[Dict], mode: str) -> str:
-        """Construct the chat prompt with passages and the requested tone."""
-        tone_instruction = MODE_INSTRUCTIONS.get(mode, MODE_INSTRUCTIONS[DEFAULT_MODE])
-        
-        context = "Here are relevant passages from the King James Bible:\n\n"
-        for i, passage in enumerate(passages, 1):
-            context += f"{i}. {passage['reference']}:\n\"{passage['text']}\"\n\n"
-        
-        return f"""You are AI Jesus, a wise and compassionate guide who provides advice based on Biblical teachings from the King James Bible. A person has asked you a question, and you have been given relevant Bible passages to help answer.
-
-Question: {query}
-
-{context}
-
-Guidance: {tone_instruction}
-
-Based on these Biblical passages, provide a thoughtful response in the voice of Jesus. Please:
-- Reference the specific Bible passages that inform your answer (e.g., cite book and verse inline).
-- Stay grounded in the provided passages; avoid inventing references.
-- Offer practical guidance that can be acted on today.
-- Keep the answer under about 180 words unless brevity would harm clarity.
-- If passages seem weakly related, briefly acknowledge that and invite the reader to explore the cited verses.
-
-Response:"""
+    def _build_prompt(self, query: str, passages: List[Passage], mode: str) -> str:
+        """
+        Construct the per-request prompt (question, passages, tone); instructions go in ANSWER_SYSTEM_PROMPT.
+        The last prompt is remembered, so running ask() and then streaming the
+        same question doesn't build it twice.
+        """
+        key = (query, mode, tuple(passages))
+        last = self._last_prompt
+        if last is not None and last[0] == key:
+            return last[1]
+        prompt = _ANSWER_PROMPTS[mode].format_map({'query': query, 'context': self._format_context(passages)})
+        self._last_prompt = (key, prompt)
+        return prompt
+    
+    def _format_context(self, passages: List[Passage]) -> str:
+        """Numbered passage list shared by the answer prompts (the last one is reused across modes)."""
+        key = tuple(passages)
+        last = self._last_context
+        if last is not None and last[0] == key:
+            return last[1]
+        context = ANSWER_CONTEXT_HEADER + _numbered_passages(self._prompt_passages(passages))
+        self._last_context = (key, context)
+        return context
     
-    def generate_response(self, query: str, passages: List[Dict], mode: Optional[str] = None) -> Dict:
+    def generate_response(self, query: str, passages: List[Passage], mode: Optional[str] = None) -> Dict:
         """
         Generate a response using Gemma3:4b based on retrieved passages.
         
@@ -187,13 +686,11 @@ Response:"""
         
         try:
             # Generate response using Gemma3:4b
-            response = ollama.generate(
+            response = ollama_client().generate(
                 model=self.llm_model,
                 prompt=prompt,
-                options={
-                    'temperature': 0.7,
-                    'top_p': 0.9,
-                },
+                system=ANSWER_SYSTEM_PROMPT,
+                options=_ANSWER_OPTIONS[selected_mode],
                 keep_alive=self.llm_keep_alive
             )
             
@@ -204,7 +701,7 @@ Response:"""
                 'mode': selected_mode
             }
         except Exception as e:
-            print(f"Error generating response: {e}")
+            logger.error("Error generating response: %s", e)
             return {
                 'answer': f"I encountered an error while generating a response. Please make sure the {self.llm_model} model is installed (run: ollama pull {self.llm_model})",
                 'passages': passages,
@@ -212,14 +709,116 @@ Response:"""
                 'mode': selected_mode
             }
 
+    def generate_bundle(
+        self,
+        query: str,
+        modes: Sequence[str] = ('balanced', 'blessing'),
+        passages: Optional[List[Passage]] = None
+    ) -> Dict:
+        """
+        Answer one question in several modes with a single generate call, so a
+        multi-panel view pays for one prompt prefill instead of one per panel.
+        
+        Args:
+            query: User's question
+            modes: Focus modes to answer in (unknown modes fall back to the default)
+            passages: Retrieved passages; retrieved here when omitted
+            
+        Returns:
+            Dict with 'answers' (mode -> answer text), passages and error flag
+        """
+        selected_modes = list(dict.fromkeys(self._normalize_mode(mode) for mode in modes))
+        if passages is None:
+            passages = self.retrieve_passages(query)
+        
+        if not passages:
+            return {
+                'answers': {},
+                'passages': [],
+                'error': True
+            }
+        
+        guidance = "\n".join([_BUNDLE_GUIDANCE[mode] for mode in selected_modes])
+        prompt = BUNDLE_PROMPT_TEMPLATE.format_map({
+            'query': query,
+            'context': self._format_context(passages),
+            'guidance': guidance
+        })
+        
+        try:
+            response = ollama_client().generate(
+                model=self.llm_model,
+                prompt=prompt,
+                system=ANSWER_SYSTEM_PROMPT,
+                format='json',
+                options={
+                    'temperature': 0.7,
+                    'top_p': 0.9,
+                    # Room for every requested answer plus the JSON around them
+                    'num_predict': ANSWER_NUM_PREDICT * len(selected_modes) + 32,
+                },
+                keep_alive=self.llm_keep_alive
+            )
+            data = orjson.loads(response['response'])
+            answers = {
+                mode: data[mode].strip()
+                for mode in selected_modes
+                if isinstance(data, dict) and isinstance(data.get(mode), str) and data[mode].strip()
+            }
+            return {
+                'answers': answers,
+                'passages': passages,
+                'error': len(answers) != len(selected_modes)
+            }
+        except Exception as e:
+            logger.error("Error generating response bundle: %s", e)
+            return {
+                'answers': {},
+                'passages': passages,
+                'error': True
+            }
+
+    def lookup_answer(self, query: str, mode: Optional[str] = None):
+        """
+        Embed the query and check the semantic answer cache.
+        Returns (embedding, cached) where cached is {'answer', 'passages'} from a
+        near-identical earlier question in the same mode, or None. The embedding
+        can be handed to retrieval so the query is only embedded once. On a miss
+        the LLM is touched so it loads while the passages are retrieved.
+        """
+        embedding = self.generate_query_embedding(query)
+        cached = None
+        if embedding is not None:
+            cached = self.answer_cache.get(embedding, self._normalize_mode(mode))
+        if cached is None:
+            self.touch_llm()
+        return embedding, cached
+
+    def remember_answer(self, embedding, mode: Optional[str], answer: str, passages: List[Passage]):
+        """Store a completed answer for future near-duplicate questions."""
+        if embedding is None or not answer:
+            return
+        self.answer_cache.put(embedding, {'answer': answer, 'passages': passages}, self._normalize_mode(mode))
+
     def ask(self, query: str, mode: Optional[str] = None) -> Dict:
         """
         Convenience wrapper that retrieves passages then generates a response.
         """
-        passages = self.retrieve_passages(query)
-        return self.generate_response(query, passages, mode=mode)
+        embedding, cached = self.lookup_answer(query, mode)
+        if cached:
+            return {
+                'answer': cached['answer'],
+                'passages': cached['passages'],
+                'error': False,
+                'mode': self._normalize_mode(mode)
+            }
+        passages = self.retrieve_passages(query, embedding)
+        result = self.generate_response(query, passages, mode=mode)
+        if not result.get('error'):
+            self.remember_answer(embedding, mode, result['answer'], passages)
+        return result
     
-    def generate_response_stream(self, query: str, passages: List[Dict], mode: Optional[str] = None):
+    def generate_response_stream(self, query: str, passages: List[Passage], mode: Optional[str] = None):
         """
         Generate a streaming response using Gemma3:4b based on retrieved passages.
         Yields response chunks as they are generated.
@@ -248,19 +847,17 @@ Response:"""
         
         try:
             # Generate streaming response using Gemma3:4b
-            stream = ollama.generate(
+            stream = ollama_client().generate(
                 model=self.llm_model,
                 prompt=prompt,
+                system=ANSWER_SYSTEM_PROMPT,
                 stream=True,
-                options={
-                    'temperature': 0.7,
-                    'top_p': 0.9,
-                },
+                options=_ANSWER_OPTIONS[selected_mode],
                 keep_alive=self.llm_keep_alive
             )
             
-            # Stream response chunks
-            for chunk in stream:
+            # Stream response chunks (pulled from Ollama on a background thread)
+            for chunk in _prefetch(stream):
                 if chunk.get('response'):
                     yield {
                         'chunk': chunk['response'],
@@ -278,13 +875,101 @@ Response:"""
             }
             
         except Exception as e:
-            print(f"Error in streaming response: {e}")
+            logger.error("Error in streaming response: %s", e)
+            yield {
+                'error': str(e),
+                'done': True,
+                'mode': selected_mode
+            }
+
+    async def generate_response_astream(self, query: str, passages: List[Passage], mode: Optional[str] = None):
+        """
+        Async variant of generate_response_stream for the ASGI entrypoint.
+        Yields the same dict chunks; closing the generator early (e.g. on client
+        disconnect) closes the HTTP stream to Ollama so generation stops.
+        """
+        selected_mode = self._normalize_mode(mode)
+
+        if not passages:
+            yield {
+                'answer': "I couldn't find relevant passages to answer your question. Please try rephrasing it.",
+                'passages': [],
+                'error': True,
+                'done': True,
+                'mode': selected_mode
+            }
+            return
+
+        prompt = self._build_prompt(query, passages, selected_mode)
+
+        try:
+            stream = await self.async_client.generate(
+                model=self.llm_model,
+                prompt=prompt,
+                system=ANSWER_SYSTEM_PROMPT,
+                stream=True,
+                options=_ANSWER_OPTIONS[selected_mode],
+                keep_alive=self.llm_keep_alive
+            )
+
+            try:
+                async for chunk in stream:
+                    if chunk.get('response'):
+                        yield {
+                            'chunk': chunk['response'],
+                            'done': chunk.get('done', False),
+                            'error': False,
+                            'mode': selected_mode
+                        }
+            finally:
+                await stream.aclose()
+
+            yield {
+                'passages': passages,
+                'done': True,
+                'error': False,
+                'mode': selected_mode
+            }
+
+        except Exception as e:
+            logger.error("Error in streaming response: %s", e)
             yield {
                 'error': str(e),
                 'done': True,
                 'mode': selected_mode
             }
 
+    def _prompt_passages(self, passages: List[Passage], limit: Optional[int] = None) -> List[Passage]:
+        """
+        The passages worth prefilling: at most limit (default max_passages) of
+        them, dropping those below min_relevance but never the best one, with
+        text cut to max_passage_chars.
+        """
+        limit = self.max_passages if limit is None else min(limit, self.max_passages)
+        selected = [
+            passage for passage in passages[:limit]
+            if passage.relevance is None or passage.relevance >= self.min_relevance
+        ] or passages[:1]
+        max_chars = self.max_passage_chars
+        if max_chars <= 0:
+            return selected
+        return [
+            replace(passage, text=passage.text[:max_chars].rstrip() + "...") if len(passage.text) > max_chars else passage
+            for passage in selected
+        ]
+
+    def build_study_prompt(self, topic: str, passages: List[Passage]) -> str:
+        """Prompt for a Bible study on topic (shared by the sync and streaming routes)."""
+        context = STUDY_CONTEXT_HEADER + _numbered_passages(self._prompt_passages(passages))
+        return STUDY_PROMPT_TEMPLATE.format_map({'topic': topic, 'context': context})
+
+    def build_prayer_prompt(self, request: str, passages: List[Passage]) -> str:
+        """Prompt for a prayer; uses at most the top three passages."""
+        context = ""
+        if passages:
+            context = PRAYER_CONTEXT_HEADER + _numbered_passages(self._prompt_passages(passages, limit=3))
+        return PRAYER_PROMPT_TEMPLATE.format_map({'request': request, 'context': context})
+
     def generate_study(self, topic: str) -> Dict:
         """
         Generate a thematic Bible study based on a topic.
@@ -298,27 +983,12 @@ Response:"""
                 'error': True
             }
             
-        context = "Here are relevant passages:\n\n"
-        for i, passage in enumerate(passages, 1):
-            context += f"{i}. {passage['reference']}:\n\"{passage['text']}\"\n\n"
-            
-        prompt = f"""You are AI Jesus, a wise teacher. Create a short Bible study on the topic: "{topic}".
-        
-{context}
-
-Structure the study as follows:
-1. **Introduction**: Briefly introduce the topic.
-2. **Key Verses**: Discuss 2-3 of the provided verses and their meaning.
-3. **Reflection**: Ask 2-3 questions to help the reader apply this to their life.
-4. **Prayer**: A short closing prayer.
-
-Keep the tone encouraging and insightful.
-"""
+        prompt = self.build_study_prompt(topic, passages)
         try:
-            response = ollama.generate(
+            response = ollama_client().generate(
                 model=self.llm_model,
                 prompt=prompt,
-                options={'temperature': 0.7},
+                options=STUDY_OPTIONS,
                 keep_alive=self.llm_keep_alive
             )
             return {
@@ -327,36 +997,125 @@ Keep the tone encouraging and insightful.
                 'error': False
             }
         except Exception as e:
-            print(f"Error generating study: {e}")
+            logger.error("Error generating study: %s", e)
             return {'study': "Error generating study.", 'error': True}
 
+    async def bulk_generate_studies(self, topics: List[str], endpoints: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Generate a study for every topic, spreading the work over several Ollama servers.
+        
+        Passages for all topics are retrieved in one batch, then each endpoint
+        gets one worker pulling topics from a shared queue, so a faster server
+        simply takes more of them and a slow one can't hold up the rest.
+        
+        Args:
+            topics: Study topics
+            endpoints: Ollama base URLs (e.g. http://gpu-2:11434); the default host when omitted
+            
+        Returns:
+            One generate_study()-shaped result per topic, in the same order
+        """
+        passages_per_topic = await asyncio.to_thread(self.retrieve_passages_batch, topics)
+        results: List[Optional[Dict]] = [None] * len(topics)
+        work: asyncio.Queue = asyncio.Queue()
+        for index, (topic, passages) in enumerate(zip(topics, passages_per_topic)):
+            if passages:
+                work.put_nowait((index, topic, passages))
+            else:
+                results[index] = {
+                    'study': "I couldn't find relevant passages for this topic. Please try a different one.",
+                    'passages': [],
+                    'error': True
+                }
+
+        async def worker(endpoint: Optional[str]):
+            client = _get_ollama().AsyncClient(host=endpoint, **_ollama_http_options())
+            try:
+                while not work.empty():
+                    index, topic, passages = work.get_nowait()
+                    try:
+                        response = await client.generate(
+                            model=self.llm_model,
+                            prompt=self.build_study_prompt(topic, passages),
+                            options=STUDY_OPTIONS,
+                            keep_alive=self.llm_keep_alive
+                        )
+                        results[index] = {
+                            'study': response['response'].strip(),
+                            'passages': passages,
+                            'error': False
+                        }
+                    except Exception as e:
+                        logger.error("Error generating study on %s: %s", endpoint or 'default host', e)
+                        results[index] = {'study': "Error generating study.", 'error': True}
+            finally:
+                # ollama's AsyncClient has no close(); shut its httpx pool directly
+                await client._client.aclose()
+
+        await asyncio.gather(*(worker(endpoint) for endpoint in (endpoints or [None])))
+        return results
+
     def generate_prayer(self, request: str) -> Dict:
         """
         Generate a personalized prayer based on a request.
         """
         passages = self.retrieve_passages(request)
         
-        context = ""
-        if passages:
-            context = "Here are some relevant verses to inspire the prayer:\n\n"
-            for i, passage in enumerate(passages[:3], 1):
-                context += f"{i}. {passage['reference']}:\n\"{passage['text']}\"\n\n"
-        
-        prompt = f"""You are AI Jesus. A user has asked for prayer: "{request}".
+        prompt = self.build_prayer_prompt(request, passages)
+        try:
+            response = ollama_client().generate(
+                model=self.llm_model,
+                prompt=prompt,
+                options=PRAYER_OPTIONS,
+                keep_alive=self.llm_keep_alive
+            )
+            return {
+                'prayer': response['response'].strip(),
+                'passages': passages,
+                'error': False
+            }
+        except Exception as e:
+            logger.error("Error generating prayer: %s", e)
+            return {'prayer': "Error generating prayer.", 'error': True}
+
+    async def generate_study_async(self, topic: str, passages: Optional[List[Passage]] = None) -> Dict:
+        """Async twin of generate_study() on the shared AsyncClient; pass passages to skip retrieval."""
+        if passages is None:
+            passages = await asyncio.to_thread(self.retrieve_passages, topic)
         
-{context}
+        if not passages:
+            return {
+                'study': "I couldn't find relevant passages for this topic. Please try a different one.",
+                'passages': [],
+                'error': True
+            }
+            
+        try:
+            response = await self.async_client.generate(
+                model=self.llm_model,
+                prompt=self.build_study_prompt(topic, passages),
+                options=STUDY_OPTIONS,
+                keep_alive=self.llm_keep_alive
+            )
+            return {
+                'study': response['response'].strip(),
+                'passages': passages,
+                'error': False
+            }
+        except Exception as e:
+            logger.error("Error generating study: %s", e)
+            return {'study': "Error generating study.", 'error': True}
 
-Write a heartfelt, comforting prayer for them. 
-- Address their specific situation.
-- Weave in the themes from the verses if applicable.
-- Keep it under 150 words.
-- End with "Amen."
-"""
+    async def generate_prayer_async(self, request: str, passages: Optional[List[Passage]] = None) -> Dict:
+        """Async twin of generate_prayer() on the shared AsyncClient; pass passages to skip retrieval."""
+        if passages is None:
+            passages = await asyncio.to_thread(self.retrieve_passages, request)
+        
         try:
-            response = ollama.generate(
+            response = await self.async_client.generate(
                 model=self.llm_model,
-                prompt=prompt,
-                options={'temperature': 0.8},
+                prompt=self.build_prayer_prompt(request, passages),
+                options=PRAYER_OPTIONS,
                 keep_alive=self.llm_keep_alive
             )
             return {
@@ -365,12 +1124,261 @@ Write a heartfelt, comforting prayer for them.
                 'error': False
             }
         except Exception as e:
-            print(f"Error generating prayer: {e}")
+            logger.error("Error generating prayer: %s", e)
             return {'prayer': "Error generating prayer.", 'error': True}
 
+    async def generate_study_and_prayer_async(self, topic: str):
+        """
+        Study and prayer for one topic: retrieve once, then run both generations
+        concurrently so Ollama can batch them (OLLAMA_NUM_PARALLEL > 1) instead
+        of decoding one after the other. Returns (study result, prayer result).
+        """
+        passages = await asyncio.to_thread(self.retrieve_passages, topic)
+        return await asyncio.gather(
+            self.generate_study_async(topic, passages),
+            self.generate_prayer_async(topic, passages),
+        )
+
+
+def resolve_mode(mode) -> str:
+    """
+    Map a requested focus mode to a supported key, DEFAULT_MODE otherwise.
+    Callers mostly pass an already-resolved key, which returns without any
+    string work.
+    """
+    if isinstance(mode, str) and mode in MODE_KEYS:
+        return mode
+    if not mode:
+        return DEFAULT_MODE
+    mode_key = str(mode).strip().lower()
+    return mode_key if mode_key in MODE_KEYS else DEFAULT_MODE
+
+
+def _numbered_passages(passages: List[Passage]) -> str:
+    """'1. Reference:\n"text"' blocks for a prompt, joined in one pass."""
+    return "".join(
+        f"{i}. {passage.reference}:\n\"{passage.text}\"\n\n"
+        for i, passage in enumerate(passages, 1)
+    )
+
+
+def _advise_willneed(path: str):
+    """Ask the OS to start reading every file under path into the page cache."""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                fd = os.open(os.path.join(root, name), os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+
+
+_STREAM_END = object()
+
+
+def _prefetch(stream, maxsize: int = STREAM_PREFETCH):
+    """
+    Iterate stream on a background thread and yield its items through a bounded queue.
+    Network reads keep going while the caller is busy sending earlier chunks.
+    Errors from the stream are re-raised in the caller, and closing the generator
+    stops the producer, which then closes the stream so Ollama stops generating.
+    """
+    items: "queue.Queue[tuple]" = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(entry) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        error = None
+        try:
+            for item in stream:
+                if not put((item, None)):
+                    break
+        except Exception as e:
+            error = e
+        finally:
+            close = getattr(stream, 'close', None)
+            if close is not None:
+                close()
+        put((_STREAM_END, error))
+
+    threading.Thread(target=produce, name="ollama-stream", daemon=True).start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is _STREAM_END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d*)?|\.\d+)(ns|us|µs|ms|s|m|h)')
+_DURATION_UNITS = {'ns': 1e-9, 'us': 1e-6, 'µs': 1e-6, 'ms': 1e-3, 's': 1, 'm': 60, 'h': 3600}
+
+
+def _keep_alive_seconds(value) -> Optional[float]:
+    """
+    Seconds for an Ollama keep_alive: a number or a Go duration string such as
+    '5m', '1h30m' or '00s'. Negative means forever; None if it can't be parsed.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    sign = -1 if text.startswith('-') else 1
+    body = text.lstrip('+-')
+    parts = _DURATION_PART.findall(body)
+    if not parts or ''.join(number + unit for number, unit in parts) != body:
+        return None
+    return sign * sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def _normalize_query(query: str) -> str:
+    """Canonical form of a query for embedding: lowercased with whitespace collapsed."""
+    return " ".join(query.lower().split())
+
+
+@lru_cache(maxsize=EMBED_CACHE_SIZE)
+def _embed_query(model: str, query: str, keep_alive) -> tuple:
+    """Embed one normalized query; failures raise, so they are never cached."""
+    return tuple(_embed_inputs(model, [query], keep_alive)[0])
+
+
+def _embed_inputs(model: str, inputs: List[str], keep_alive) -> List[List[float]]:
+    """
+    Embed a list of texts with one /api/embed request. Ollama servers older
+    than 0.3 don't have that endpoint (404) or answer without 'embeddings';
+    those fall back to one legacy /api/embeddings call per text.
+    """
+    client = ollama_client()
+    try:
+        response = client.embed(model=model, input=inputs, keep_alive=keep_alive)
+    except _get_ollama().ResponseError as e:
+        if e.status_code != 404:
+            raise
+        response = {}
+    if 'embeddings' in response:
+        return response['embeddings']
+    return [
+        client.embeddings(model=model, prompt=text, keep_alive=keep_alive)['embedding']
+        for text in inputs
+    ]
+
+
+class RetrievalBatcher:
+    """
+    Micro-batches concurrent retrieval requests.
+    
+    Requests arriving within max_wait_ms of each other (up to max_batch) are
+    served by one BibleRAG.retrieve_passages_batch call, so the vector search
+    runs once per batch instead of once per question. Identical questions in a
+    batch are retrieved once. A request that isn't served within timeout
+    seconds raises TimeoutError instead of blocking its handler forever.
+    """
+    
+    def __init__(self, rag: "BibleRAG", max_batch: int = 8, max_wait_ms: float = 50,
+                 timeout: float = RETRIEVAL_TIMEOUT):
+        self.rag = rag
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.timeout = timeout
+        self._queue: "queue.Queue[tuple[str, Optional[List[float]], Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_pid: Optional[int] = None
+    
+    def submit(self, query: str, embedding: Optional[List[float]] = None) -> List[Passage]:
+        """Queue a query (optionally with its embedding) and block until its passages are available."""
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((query, embedding, future))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # The worker skips cancelled futures, so a late batch doesn't touch this one
+            future.cancel()
+            raise TimeoutError(f"Retrieval timed out after {self.timeout:g}s")
+    
+    def _ensure_worker(self):
+        """Start the batching thread lazily (and again in forked server workers)."""
+        pid = os.getpid()
+        if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+                return
+            if self._worker_pid != pid:
+                # A forked worker inherits the parent's queue but not its thread
+                self._queue = queue.Queue()
+            self._worker = threading.Thread(target=self._run, name="retrieval-batcher", daemon=True)
+            self._worker_pid = pid
+            self._worker.start()
+    
+    def _collect_batch(self) -> List[tuple]:
+        """Block for one request, then gather more until the window closes."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = []
+            try:
+                batch = [
+                    item for item in self._collect_batch()
+                    if item[2].set_running_or_notify_cancel()
+                ]
+                if not batch:
+                    continue
+                unique = {}
+                for query, embedding, _ in batch:
+                    if unique.get(query) is None:
+                        unique[query] = embedding
+                unique_queries = list(unique)
+                results = dict(zip(
+                    unique_queries,
+                    self.rag.retrieve_passages_batch(unique_queries, [unique[query] for query in unique_queries])
+                ))
+                for query, _, future in batch:
+                    future.set_result(results[query])
+            except Exception as e:
+                # Fail this batch's callers but keep the worker alive for the next one
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
 
 def main():
     """Test the RAG pipeline."""
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     print("=" * 60)
     print("Testing What Would AI Jesus Do RAG Pipeline")
     print("=" * 60)
@@ -397,8 +1405,8 @@ def main():
     print("📚 Source Passages:")
     print("=" * 60)
     for i, passage in enumerate(result['passages'][:3], 1):
-        print(f"\n{i}. {passage['reference']}:")
-        print(f"   {passage['text'][:200]}...")
+        print(f"\n{i}. {passage.reference}:")
+        print(f"   {passage.text[:200]}...")
 
 
 if __name__ == "__main__":
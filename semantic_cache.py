@@ -0,0 +1,128 @@
+"""
+Semantic answer cache for What Would AI Jesus Do
+Remembers recent answers keyed by the question embedding so near-duplicate
+questions ("what would jesus do about X" variants) skip retrieval and the LLM.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Sequence
+
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Bounded, thread-safe cache of answers looked up by cosine similarity.
+
+    Vectors are bucketed with random-hyperplane LSH: each of `tables` tables
+    hashes a vector to a `bits`-bit signature (one sign bit per hyperplane).
+    A lookup only compares against entries sharing a bucket in at least one
+    table, then returns the closest one at or above `threshold`. Several
+    tables keep recall up; a single 16-bit table agrees on every bit for
+    only ~1 in 5 pairs at cosine 0.95.
+
+    Entries are namespaced (e.g. by answer mode) and evicted least recently
+    used once `capacity` is reached.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 1024,
+        threshold: float = 0.95,
+        bits: int = 16,
+        tables: int = 8,
+        seed: int = 0,
+    ):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.bits = bits
+        self.tables = tables
+        self._rng = np.random.default_rng(seed)
+        self._planes: Optional[np.ndarray] = None
+        self._bit_weights = 1 << np.arange(bits, dtype=np.int64)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._buckets: dict = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def get(self, vector: Sequence[float], namespace: Hashable = None) -> Optional[Any]:
+        """Return the cached value for the nearest matching vector, or None."""
+        if self.capacity <= 0:
+            return None
+        unit = self._unit(vector)
+        if unit is None:
+            return None
+
+        with self._lock:
+            if self._planes is None or self._planes.shape[2] != unit.shape[0]:
+                return None
+            candidates = set()
+            for bucket in self._bucket_keys(unit, namespace):
+                candidates.update(self._buckets.get(bucket, ()))
+            if not candidates:
+                return None
+
+            ids = list(candidates)
+            matrix = np.stack([self._entries[entry_id][1] for entry_id in ids])
+            scores = matrix @ unit
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+
+            entry_id = ids[best]
+            self._entries.move_to_end(entry_id)
+            return self._entries[entry_id][2]
+
+    def put(self, vector: Sequence[float], value: Any, namespace: Hashable = None):
+        """Store a value under the given vector."""
+        if self.capacity <= 0:
+            return
+        unit = self._unit(vector)
+        if unit is None:
+            return
+
+        with self._lock:
+            if self._planes is None or self._planes.shape[2] != unit.shape[0]:
+                # First vector (or a new embedding model): draw hyperplanes for this size.
+                self._planes = self._rng.standard_normal((self.tables, self.bits, unit.shape[0]))
+                self._entries.clear()
+                self._buckets.clear()
+
+            buckets = self._bucket_keys(unit, namespace)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (buckets, unit, value)
+            for bucket in buckets:
+                self._buckets.setdefault(bucket, set()).add(entry_id)
+
+            while len(self._entries) > self.capacity:
+                old_id, (old_buckets, _, _) = self._entries.popitem(last=False)
+                for bucket in old_buckets:
+                    members = self._buckets.get(bucket)
+                    if members is not None:
+                        members.discard(old_id)
+                        if not members:
+                            del self._buckets[bucket]
+
+    def clear(self):
+        """Drop every cached entry."""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _bucket_keys(self, unit: np.ndarray, namespace: Hashable) -> tuple:
+        signs = (self._planes @ unit) > 0
+        signatures = signs.astype(np.int64) @ self._bit_weights
+        return tuple((namespace, table, int(signature)) for table, signature in enumerate(signatures))
+
+    @staticmethod
+    def _unit(vector: Sequence[float]) -> Optional[np.ndarray]:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(array))
+        if array.ndim != 1 or norm == 0.0:
+            return None
+        return array / norm
@@ -8,6 +8,8 @@ import subprocess
 import os
 from pathlib import Path
 
+from model_cache import load_dim_cache, save_dim_cache
+
 
 def check_python_version():
     """Check if Python version is 3.8 or higher."""
@@ -21,42 +23,57 @@ def check_python_version():
 
 
 def check_ollama():
-    """Check if Ollama is installed and running."""
+    """
+    Check if Ollama is installed and running.
+    Returns (ok, models_list) so the model check can reuse the listing.
+    """
     try:
         import ollama
-        ollama.list()
+        models_list = ollama.list()
         print("✅ Ollama is installed and running")
-        return True
+        return True, models_list
     except ImportError:
         print("❌ Ollama Python package not installed")
-        return False
+        return False, None
     except Exception as e:
         print("❌ Ollama is not running or not accessible")
         print(f"   Please start Ollama first: {e}")
-        return False
+        return False, None
 
 
-def check_ollama_models():
-    """Check if required Ollama models are available."""
+def check_ollama_models(models_list=None):
+    """Check if required Ollama models are available (models_list: a prior ollama.list() result)."""
     try:
-        import ollama
-        models_list = ollama.list()
-        model_names = [model['name'] for model in models_list.get('models', [])]
+        if models_list is None:
+            import ollama
+            models_list = ollama.list()
+        models = models_list.get('models', [])
+        model_names = [model['name'].lower() for model in models]
         
-        has_gemma_embed = any('embeddinggemma' in name.lower() for name in model_names)
-        has_gemma3 = any('gemma3:4b' in name.lower() for name in model_names)
+        embed_model = os.getenv('WWAIJD_EMBED_MODEL', 'embeddinggemma')
+        llm_model = os.getenv('WWAIJD_LLM_MODEL', 'gemma3:4b')
+        # One newline-joined string: each check is a single substring scan, and no
+        # match can span two names
+        joined_names = "\n".join(model_names)
+        has_gemma_embed = embed_model in joined_names
+        has_gemma3 = llm_model in joined_names
         
         if not has_gemma_embed:
-            print("⚠️  Embedding Gemma model not found")
-            print("   Run: ollama pull embeddinggemma")
+            print(f"⚠️  Embedding model {embed_model} not found")
+            print(f"   Run: ollama pull {embed_model}")
         else:
-            print("✅ Gemma embeddings model found")
+            print(f"✅ Embedding model {embed_model} found")
+            digest = next(
+                (model.get('digest') for model, name in zip(models, model_names) if embed_model in name),
+                None
+            )
+            check_embedding_dimension(embed_model, digest)
         
         if not has_gemma3:
-            print("⚠️  Gemma3:4b model not found")
-            print("   Run: ollama pull gemma3:4b")
+            print(f"⚠️  {llm_model} model not found")
+            print(f"   Run: ollama pull {llm_model}")
         else:
-            print("✅ Gemma3:4b model found")
+            print(f"✅ {llm_model} model found")
         
         return has_gemma_embed and has_gemma3
     except Exception as e:
@@ -64,6 +81,26 @@ def check_ollama_models():
         return False
 
 
+def check_embedding_dimension(embed_model, digest):
+    """
+    Record the embedding model's output dimension. A cached entry with the
+    same Ollama digest is trusted as is; otherwise one probe embed measures it.
+    """
+    cached = load_dim_cache().get(embed_model)
+    if cached and digest and cached.get('digest') == digest:
+        print(f"✅ Embedding dimension {cached['dim']} (cached)")
+        return cached['dim']
+    try:
+        import ollama
+        dim = len(ollama.embed(model=embed_model, input='dimension probe')['embeddings'][0])
+    except Exception as e:
+        print(f"⚠️  Could not probe embedding dimension: {e}")
+        return None
+    save_dim_cache(embed_model, dim, digest)
+    print(f"✅ Embedding dimension {dim}")
+    return dim
+
+
 def check_dependencies():
     """Check if required Python packages are installed."""
     required = ['flask', 'chromadb', 'ollama']
@@ -120,11 +157,12 @@ def main():
     
     # Check Ollama
     print("🤖 Checking Ollama...\n")
-    if not check_ollama():
+    ollama_ok, models_list = check_ollama()
+    if not ollama_ok:
         print("\n💡 Install Ollama from: https://ollama.com/")
         all_checks_passed = False
     else:
-        check_ollama_models()
+        check_ollama_models(models_list)
     
     print()
     
@@ -0,0 +1,277 @@
+"""
+Flat vector index for What Would AI Jesus Do
+The KJV corpus is small enough that an exact scan (one matrix product over
+every passage embedding) is fast and has no recall to tune. The index is
+written next to the ChromaDB database by build_embeddings.py and loaded at
+startup, along with a standalone hnswlib graph over the same vectors for
+deployments that prefer approximate search without Chroma's query layer.
+"""
+
+import mmap
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import orjson
+
+# Subdirectory of the database path that holds the flat index files.
+FLAT_INDEX_DIRNAME = "flat_index"
+EMBEDDINGS_FILE = "embeddings.npy"
+HNSW_FILE = "bible.hnsw"
+SCALES_FILE = "scales.npy"
+PASSAGES_FILE = "passages.json"
+# Passage text as one UTF-8 blob plus row boundaries; only returned rows are decoded.
+TEXTS_FILE = "passages.txt"
+OFFSETS_FILE = "offsets.npy"
+# On-disk precision, chosen when build_embeddings.py writes the index. float16
+# halves the file and its cold-start read with no meaningful recall loss. int8
+# (symmetric, one float32 scale per vector) quarters it; expect the odd swap
+# between near-tied neighbours. Either way vectors are widened to float32 once
+# at load, since numpy has no SIMD half-precision or int8 matmul.
+# Only save() reads the setting (load() takes the dtype stored in the file), so a
+# bad value fails the build, not the web server importing this module.
+STORAGE_DTYPES = ("float32", "float16", "int8")
+STORAGE_DTYPE = os.getenv("WWAIJD_FLAT_INDEX_DTYPE", "float16")
+
+
+def storage_dtype(value=STORAGE_DTYPE) -> np.dtype:
+    """The numpy dtype for an on-disk precision, or ValueError if it isn't supported."""
+    try:
+        dtype = np.dtype(value)
+    except TypeError:
+        dtype = None
+    if dtype is None or dtype.name not in STORAGE_DTYPES:
+        raise ValueError(f"WWAIJD_FLAT_INDEX_DTYPE must be one of {', '.join(STORAGE_DTYPES)}, not {value!r}")
+    return dtype
+
+
+class FlatIndex:
+    """
+    Exact cosine-similarity search over unit-normalized passage embeddings.
+
+    query() returns the same shape as chromadb's Collection.query (documents,
+    metadatas and cosine distances, one row per query), so it can stand in
+    for the collection on the retrieval path.
+    """
+
+    def __init__(self, embeddings: np.ndarray, documents: List[str], metadatas: List[Dict]):
+        if len(embeddings) != len(documents) or len(documents) != len(metadatas):
+            raise ValueError("embeddings, documents and metadatas must have the same length")
+        self.embeddings = embeddings
+        self.documents = documents
+        self.metadatas = metadatas
+
+    @classmethod
+    def load(cls, directory: str) -> "FlatIndex":
+        """
+        Open an index written by save(). float32 files are memory-mapped; reduced
+        precision files are widened to float32 in memory (int8 rows are scaled
+        back and re-normalized).
+        """
+        embeddings = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode="r")
+        if embeddings.dtype == np.int8:
+            scales = np.load(os.path.join(directory, SCALES_FILE))
+            embeddings = _unit_rows(embeddings.astype(np.float32) * scales[:, None])
+        elif embeddings.dtype != np.float32:
+            embeddings = embeddings.astype(np.float32)
+        return cls(embeddings, *_load_passages(directory))
+
+    @staticmethod
+    def save(
+        directory: str,
+        embeddings: Sequence[Sequence[float]],
+        documents: List[str],
+        metadatas: List[Dict],
+        dtype=STORAGE_DTYPE,
+    ):
+        """Normalize the embeddings and write them (as dtype) with their passages to directory."""
+        dtype = storage_dtype(dtype)
+        os.makedirs(directory, exist_ok=True)
+        matrix = _unit_rows(np.asarray(embeddings, dtype=np.float32))
+        scales_path = os.path.join(directory, SCALES_FILE)
+        if dtype == np.int8:
+            matrix, scales = _quantize_rows(matrix)
+            np.save(scales_path, scales)
+        else:
+            matrix = matrix.astype(dtype)
+            if os.path.exists(scales_path):
+                os.remove(scales_path)
+        np.save(os.path.join(directory, EMBEDDINGS_FILE), matrix)
+
+        encoded = [document.encode("utf-8") for document in documents]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in encoded], out=offsets[1:])
+        with open(os.path.join(directory, TEXTS_FILE), "wb") as f:
+            f.write(b"".join(encoded))
+        np.save(os.path.join(directory, OFFSETS_FILE), offsets)
+        with open(os.path.join(directory, PASSAGES_FILE), "wb") as f:
+            f.write(orjson.dumps({"metadatas": metadatas}))
+
+    @property
+    def dim(self) -> int:
+        return self.embeddings.shape[1]
+
+    def count(self) -> int:
+        return len(self.documents)
+
+    def query(self, query_embeddings: Sequence[Sequence[float]], n_results: int = 5, **_) -> Dict:
+        """Nearest passages for each query embedding, closest first."""
+        queries = _unit_rows(np.asarray(query_embeddings, dtype=np.float32))
+        k = min(n_results, len(self.documents))
+        if k <= 0:
+            return _query_result(self.documents, self.metadatas, [[] for _ in queries], [[] for _ in queries])
+
+        scores = queries @ self.embeddings.T
+        labels = []
+        distances = []
+        for row in scores:
+            if k < len(row):
+                top = np.argpartition(-row, k - 1)[:k]
+                top = top[np.argsort(-row[top], kind="stable")]
+            else:
+                top = np.argsort(-row, kind="stable")
+            labels.append(top)
+            # Cosine distance, matching the collection's hnsw:space
+            distances.append(1.0 - row[top])
+        return _query_result(self.documents, self.metadatas, labels, distances)
+
+
+class MappedTexts(Sequence):
+    """
+    Read-only list of passage texts backed by a memory-mapped file. Nothing is
+    read or decoded until a row is indexed, so startup doesn't build one
+    Python string per passage and untouched text stays out of memory.
+    """
+
+    def __init__(self, path: str, offsets: np.ndarray):
+        self._offsets = offsets.tolist()
+        with open(path, "rb") as f:
+            # mmap can't map an empty file
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("passage index out of range")
+        return self._data[self._offsets[i]:self._offsets[i + 1]].decode("utf-8")
+
+
+class HnswIndex:
+    """
+    hnswlib graph over the flat index's vectors, queried directly: one
+    knn_query call per batch, with none of Chroma's sqlite or result
+    marshalling in between. Same query() shape as FlatIndex.
+    """
+
+    def __init__(self, index, documents: List[str], metadatas: List[Dict]):
+        if index.get_current_count() != len(documents) or len(documents) != len(metadatas):
+            raise ValueError("index, documents and metadatas must have the same length")
+        self.index = index
+        self.documents = documents
+        self.metadatas = metadatas
+
+    @classmethod
+    def load(cls, directory: str, dim: int, search_ef: int = 64) -> "HnswIndex":
+        """Open the graph written by save() (dim must match the stored vectors)."""
+        import hnswlib
+
+        index = hnswlib.Index(space="cosine", dim=dim)
+        index.load_index(os.path.join(directory, HNSW_FILE))
+        index.set_ef(search_ef)
+        return cls(index, *_load_passages(directory))
+
+    @staticmethod
+    def save(directory: str, embeddings: Sequence[Sequence[float]], M: int = 32, construction_ef: int = 200):
+        """Build the graph over embeddings (labels are row numbers) and write it to directory."""
+        import hnswlib
+
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        index = hnswlib.Index(space="cosine", dim=matrix.shape[1])
+        index.init_index(max_elements=len(matrix), M=M, ef_construction=construction_ef)
+        index.add_items(matrix, np.arange(len(matrix)))
+        os.makedirs(directory, exist_ok=True)
+        index.save_index(os.path.join(directory, HNSW_FILE))
+
+    @property
+    def dim(self) -> int:
+        return self.index.dim
+
+    def count(self) -> int:
+        return len(self.documents)
+
+    def query(self, query_embeddings: Sequence[Sequence[float]], n_results: int = 5, **_) -> Dict:
+        """Approximate nearest passages for each query embedding, closest first."""
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.index.dim)
+        k = min(n_results, len(self.documents))
+        if k <= 0:
+            return _query_result(self.documents, self.metadatas, [[] for _ in queries], [[] for _ in queries])
+        if self.index.ef < k:
+            self.index.set_ef(k)
+        labels, distances = self.index.knn_query(queries, k=k)
+        return _query_result(self.documents, self.metadatas, labels, distances)
+
+
+def open_flat_index(db_path: str) -> Optional[FlatIndex]:
+    """Load the flat index stored under db_path, or None when it has not been built."""
+    directory = os.path.join(db_path, FLAT_INDEX_DIRNAME)
+    if not os.path.exists(os.path.join(directory, EMBEDDINGS_FILE)):
+        return None
+    return FlatIndex.load(directory)
+
+
+def open_hnsw_index(db_path: str, search_ef: int = 64) -> Optional[HnswIndex]:
+    """Load the hnswlib graph stored under db_path, or None when it has not been built."""
+    directory = os.path.join(db_path, FLAT_INDEX_DIRNAME)
+    if not os.path.exists(os.path.join(directory, HNSW_FILE)):
+        return None
+    # The graph file doesn't record its dimension; read it from the embeddings header
+    dim = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode="r").shape[1]
+    return HnswIndex.load(directory, dim, search_ef)
+
+
+def _load_passages(directory: str):
+    """(documents, metadatas) stored by FlatIndex.save; indexes built before the text file carry documents in the JSON."""
+    with open(os.path.join(directory, PASSAGES_FILE), "rb") as f:
+        passages = orjson.loads(f.read())
+    texts_path = os.path.join(directory, TEXTS_FILE)
+    if "documents" in passages or not os.path.exists(texts_path):
+        return passages["documents"], passages["metadatas"]
+    offsets = np.load(os.path.join(directory, OFFSETS_FILE))
+    return MappedTexts(texts_path, offsets), passages["metadatas"]
+
+
+def _query_result(documents: List[str], metadatas: List[Dict], labels, distances) -> Dict:
+    """Chroma-shaped query result from per-query label and distance rows."""
+    result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+    for row_labels, row_distances in zip(labels, distances):
+        # Plain ints: hnswlib labels are uint64, which turn into floats in arithmetic
+        row_labels = np.asarray(row_labels, dtype=np.int64).tolist()
+        result["ids"].append([str(i) for i in row_labels])
+        result["documents"].append([documents[i] for i in row_labels])
+        result["metadatas"].append([metadatas[i] for i in row_labels])
+        result["distances"].append(np.asarray(row_distances, dtype=float).tolist())
+    return result
+
+
+def _quantize_rows(matrix: np.ndarray):
+    """Symmetric int8 quantization: q = round(v * 127 / max|v|) per row, with that row's scale."""
+    peaks = np.abs(matrix).max(axis=1)
+    peaks[peaks == 0] = 1.0
+    scales = (peaks / 127).astype(np.float32)
+    quantized = np.rint(matrix / scales[:, None]).astype(np.int8)
+    return quantized, scales
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length (zero rows are left as zeros)."""
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms